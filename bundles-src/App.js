@@ -62,27 +62,44 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    // Один ключ на заказ: повторные отправки того же заказа сервер не продублирует
+    let body = JSON.stringify(data);
+    if (this.orderIdempotencyBody !== body){
+      this.orderIdempotencyBody = body;
+      this.orderIdempotencyKey = window.crypto && window.crypto.randomUUID
+        ? window.crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    }
+
     try {
-      let response = await fetch(url, {
-        method: 'post',
-        headers: {
-          'Accept': 'application/json',
-          'Content-Type': 'application/json',
-          'X-CSRFToken': csrfToken,
-        },
-        body: JSON.stringify(data),
-      });
+      let response = await this.postOrder(url, body, csrfToken, this.orderIdempotencyKey);
 
       if (!response.ok){
         alert('Ошибка при оформлении заказа. Попробуйте ещё раз или свяжитесь с нами по телефону.');
         return;
       }
       let responseData = await response.json();
+      if (response.status === 202){
+        // Заказ принят в очередь: ждём, пока сервер его создаст
+        responseData = await this.waitForOrder(responseData);
+      }
+
+      this.orderIdempotencyBody = null;
+      this.orderIdempotencyKey = null;
 
+      if (responseData.status === 'fld'){
+        // Заявку не удалось превратить в заказ: корзину оставляем, чтобы оформить заново
+        alert('Ошибка при оформлении заказа. Попробуйте ещё раз или свяжитесь с нами по телефону.');
+        return;
+      }
       this.setState({
         cart: [],
       });
 
+      if (responseData.status === 'err'){
+        alert('Не удалось оформить заказ: часть товаров закончилась. Пожалуйста, соберите корзину заново.');
+        return;
+      }
       alert("Заказ оформлен. Вам перезвонят в течение 10 минут.");
 
       this.handleCartClose();
@@ -93,6 +110,48 @@ class App extends Component {
   }
 
 
+  async postOrder(url, body, csrfToken, idempotencyKey, attempts=3){
+    for (let attempt = 1; ; attempt++){
+      try {
+        return await fetch(url, {
+          method: 'post',
+          headers: {
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrfToken,
+            'Idempotency-Key': idempotencyKey,
+          },
+          body,
+        });
+      } catch(error){
+        // Сеть оборвалась: повторяем с тем же ключом
+        if (attempt >= attempts){
+          throw error;
+        }
+        await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+      }
+    }
+  }
+
+
+  async waitForOrder(intake, attempts=30){
+    for (let attempt = 0; attempt < attempts && intake.status === 'pnd'; attempt++){
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      try {
+        let response = await fetch(intake.status_url, {
+          headers: {'Accept': 'application/json'},
+        });
+        if (response.ok){
+          intake = await response.json();
+        }
+      } catch(error){
+        // Заявка уже сохранена на сервере, сбой опроса не мешает заказу
+      }
+    }
+    return intake;
+  }
+
+
   updateToken(NewToken){
 
     this.setState({
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import admin
 from django.http import HttpResponseRedirect
 from django.shortcuts import reverse
@@ -5,18 +6,27 @@ from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.db import models
-from django.db.models import Count, Q
+from django.db.models import Case, When
 
 from .models import (
     Order,
+    OrderIntake,
     OrderItem,
     Restaurant,
     Product,
     RestaurantMenuItem,
     ProductCategory,
 )
+from .availability import get_availability_index
+from .candidates import rebuild_order_candidates_on_commit
+from .transitions import start_cooking
+from .spatial import get_restaurant_index
+from places.cache import get_coordinate_cache
 from star_burger.settings import ALLOWED_HOSTS
 
+# Сколько ближайших ресторанов поднимать наверх списка в карточке заказа
+NEAREST_RESTAURANTS_COUNT = 10
+
 
 class RestaurantMenuItemInline(admin.TabularInline):
     model = RestaurantMenuItem
@@ -34,6 +44,11 @@ class RestaurantAdmin(admin.ModelAdmin):
         'name',
         'address',
         'contact_phone',
+        'capacity',
+    ]
+    readonly_fields = [
+        'latitude',
+        'longitude',
     ]
     inlines = [
         RestaurantMenuItemInline
@@ -137,10 +152,16 @@ class OrderAdmin(admin.ModelAdmin):
         'firstname',
         'lastname',
         'address',
+        'total_price',
+    ]
+    readonly_fields = [
+        'total_price',
     ]
 
     def save_formset(self, request, form, formset, change):
         order_items = formset.save(commit=False)
+        for item in formset.deleted_objects:
+            item.delete()
         for item in order_items:
             if item.price == 0.00:
                 product = Product.objects.get(id=item.product.id)
@@ -148,6 +169,11 @@ class OrderAdmin(admin.ModelAdmin):
                 item.save()
             else:
                 item.save()
+        Order.objects.filter(pk=form.instance.pk).update_total_price()
+        # Менеджер мог назначить ресторан: новый заказ начинает готовиться
+        start_cooking([form.instance.pk])
+        # Адрес, ресторан или состав заказа могли измениться
+        rebuild_order_candidates_on_commit([form.instance.pk])
 
     def response_post_save_change(self, request, obj):
         res = super().response_post_save_change(request, obj)
@@ -160,6 +186,7 @@ class OrderAdmin(admin.ModelAdmin):
             return res
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        order = None
         if db_field.name == "restaurant":
             # Получаем ID товаров из запроса (если они уже добавлены в заказ)
             order_id = request.resolver_match.kwargs.get('object_id')
@@ -172,17 +199,63 @@ class OrderAdmin(admin.ModelAdmin):
 
             # Если есть товары в заказе, фильтруем рестораны
             if product_ids:
-                # Получаем рестораны, у которых есть *все* товары из заказа в меню *и* они доступны
-                available_restaurants = Restaurant.objects.annotate(
-                    num_matching_products=Count(
-                        'menu_items',
-                        filter=Q(menu_items__product_id__in=product_ids) & Q(menu_items__availability=True)
-                    )
-                ).filter(num_matching_products=len(product_ids)).distinct()
-
-                kwargs["queryset"] = available_restaurants
+                # Рестораны, у которых есть *все* товары из заказа в меню *и* они доступны
+                available_restaurants = get_availability_index().get_restaurants(product_ids)
+                kwargs["queryset"] = Restaurant.objects.filter(
+                    pk__in=[restaurant.id for restaurant in available_restaurants]
+                )
             else:
                 # Если товаров нет, показываем все рестораны
                 kwargs["queryset"] = Restaurant.objects.all()
 
-        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if order:
+            self.sort_restaurants_by_distance(formfield, order)
+        return formfield
+
+    def sort_restaurants_by_distance(self, formfield, order):
+        coordinates = get_coordinate_cache().get(order.address)
+        if not coordinates:
+            return
+        # Индекс обходит только ячейки вокруг заказа, остальные рестораны идут ниже по названию
+        distances = dict(get_restaurant_index().nearest(
+            *coordinates,
+            k=NEAREST_RESTAURANTS_COUNT,
+            radius_km=settings.DELIVERY_RADIUS_KM,
+            restaurant_ids=formfield.queryset.values_list('id', flat=True),
+        ))
+        nearest_ids = sorted(distances, key=distances.get)
+        formfield.queryset = formfield.queryset.order_by(
+            Case(
+                *[When(pk=pk, then=position) for position, pk in enumerate(nearest_ids)],
+                default=len(nearest_ids),
+            ),
+            'name',
+        )
+        formfield.label_from_instance = lambda restaurant: (
+            f'{restaurant.name} — {distances[restaurant.id]:.2f} км'
+            if restaurant.id in distances else restaurant.name
+        )
+
+
+@admin.register(OrderIntake)
+class OrderIntakeAdmin(admin.ModelAdmin):
+    list_display = [
+        'tracking_id',
+        'status',
+        'created_at',
+        'processed_at',
+        'order',
+    ]
+    list_filter = [
+        'status',
+    ]
+    readonly_fields = [
+        'tracking_id',
+        'order',
+        'errors',
+        'processed_at',
+    ]
+    raw_id_fields = [
+        'order',
+    ]
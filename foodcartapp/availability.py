@@ -0,0 +1,77 @@
+import logging
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+from .caching import bump_version, get_version
+from .models import Restaurant, RestaurantMenuItem
+
+logger = logging.getLogger(__name__)
+
+AVAILABILITY_VERSION = 'restaurant_availability'
+
+
+class AvailabilityIndex:
+    """Для каждого товара — битовая маска ресторанов, где он сейчас в продаже.
+
+    Рестораны, которые могут приготовить весь заказ, — побитовое И масок
+    товаров заказа, без запросов к базе.
+    """
+
+    def __init__(self, restaurants, available_items):
+        self.restaurants = list(restaurants)
+        self.positions = {
+            restaurant.id: position for position, restaurant in enumerate(self.restaurants)
+        }
+        self.all_restaurants_mask = (1 << len(self.restaurants)) - 1
+        self.bitmaps = defaultdict(int)
+        for restaurant_id, product_id in available_items:
+            if restaurant_id in self.positions:
+                self.bitmaps[product_id] |= 1 << self.positions[restaurant_id]
+        self.version = None
+
+    def get_mask(self, product_ids):
+        mask = self.all_restaurants_mask
+        for product_id in set(product_ids):
+            mask &= self.bitmaps.get(product_id, 0)
+            if not mask:
+                break
+        return mask
+
+    def get_restaurants(self, product_ids):
+        mask = self.get_mask(product_ids)
+        restaurants = []
+        while mask:
+            lowest_bit = mask & -mask
+            restaurants.append(self.restaurants[lowest_bit.bit_length() - 1])
+            mask ^= lowest_bit
+        return restaurants
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_availability_index():
+    """Индекс доступности процесса; перестраивается после изменения меню в любом процессе."""
+    global _index
+    version = get_version(AVAILABILITY_VERSION)
+    with _index_lock:
+        if _index is None or _index.version != version:
+            available_items = (
+                RestaurantMenuItem.objects
+                .filter(availability=True)
+                .values_list('restaurant_id', 'product_id')
+            )
+            index = AvailabilityIndex(Restaurant.objects.order_by('id'), available_items)
+            index.version = version
+            _index = index
+            logger.info(f"Индекс доступности перестроен: {len(index.restaurants)} ресторанов")
+        return _index
+
+
+def invalidate_availability_index():
+    # Версию меняем только после фиксации: иначе другой процесс успеет
+    # собрать индекс из старых данных и закрепить его за новой версией
+    transaction.on_commit(lambda: bump_version(AVAILABILITY_VERSION))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def _version_key(name):
+    return f'version:{name}'
+
+
+def get_version(name):
+    """Текущая версия набора данных, общая для всех процессов через кэш."""
+    # Начальное значение от времени, чтобы после сброса кэша версия не повторилась
+    return cache.get_or_set(_version_key(name), time.time_ns, timeout=None)
+
+
+def is_cache_shared():
+    """Видят ли другие процессы версии из кэша: кэш в памяти у каждого процесса свой."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def bump_version(name):
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
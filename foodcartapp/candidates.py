@@ -0,0 +1,271 @@
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Now
+
+from places.cache import get_coordinate_cache
+from .distances import distance_matrix
+from .models import Order, OrderCandidate, OrderItem, Restaurant
+from .spatial import load_restaurant_coordinates
+
+logger = logging.getLogger(__name__)
+
+
+def match_orders_with_restaurants(order_items, restaurant_ids=None):
+    """Пары (order_id, restaurant_id): ресторан готовит все товары заказа.
+
+    Один SQL-запрос на все заказы: позиции заказов соединяются с доступными
+    пунктами меню по товару, а HAVING оставляет рестораны, у которых число
+    совпавших товаров равно числу разных товаров в заказе.
+    """
+    order_product_count = (
+        OrderItem.objects
+        .filter(order_id=OuterRef('order_id'))
+        .values('order_id')
+        .annotate(product_count=Count('product_id', distinct=True))
+        .values('product_count')
+    )
+    # Условия на пункт меню задаём одним filter(), чтобы они относились к одному JOIN
+    menu_item_filters = {'product__menu_items__availability': True}
+    if restaurant_ids is not None:
+        menu_item_filters['product__menu_items__restaurant_id__in'] = list(restaurant_ids)
+    matches = (
+        order_items
+        .filter(**menu_item_filters)
+        .values_list('order_id', 'product__menu_items__restaurant_id')
+        .annotate(matched_products=Count('product_id', distinct=True))
+        .filter(matched_products=Subquery(order_product_count))
+        .order_by()
+    )
+    return [(order_id, restaurant_id) for order_id, restaurant_id, _ in matches]
+
+
+def match_orders_without_items(orders, restaurant_ids=None):
+    """Пары (order_id, restaurant_id) для заказов без позиций: такой заказ подходит любому ресторану."""
+    order_ids = list(orders.filter(items__isnull=True).values_list('id', flat=True))
+    if not order_ids:
+        return []
+    restaurants = Restaurant.objects.all()
+    if restaurant_ids is not None:
+        restaurants = restaurants.filter(id__in=list(restaurant_ids))
+    restaurant_ids = list(restaurants.values_list('id', flat=True))
+    return [(order_id, restaurant_id) for order_id in order_ids for restaurant_id in restaurant_ids]
+
+
+def get_available_restaurants_for_orders(orders):
+    """Рестораны, способные приготовить каждый заказ целиком: {order_id: [restaurant_id, ...]}."""
+    order_ids = [order.id for order in orders]
+    available_restaurants = {order_id: [] for order_id in order_ids}
+    if not order_ids:
+        return available_restaurants
+    matches = match_orders_with_restaurants(OrderItem.objects.filter(order_id__in=order_ids))
+    matches += match_orders_without_items(Order.objects.filter(id__in=order_ids))
+    for order_id, restaurant_id in matches:
+        available_restaurants[order_id].append(restaurant_id)
+    return available_restaurants
+
+
+def is_deliverable(distance_km):
+    # Радиус доставки включается настройкой, по умолчанию подходят рестораны на любом расстоянии
+    return settings.DELIVERY_RADIUS_KM is None or distance_km <= settings.DELIVERY_RADIUS_KM
+
+
+def rebuild_order_candidates(order_ids):
+    """Пересчитывает рестораны-кандидаты заказов, возвращает число записанных кандидатов.
+
+    Кандидаты — рестораны, которые готовят заказ целиком (в радиусе
+    DELIVERY_RADIUS_KM, если он задан), или выбранный ресторан, если он уже назначен. У закрытых, отменённых
+    и ещё не геокодированных заказов кандидатов нет.
+    """
+    order_ids = sorted(set(order_ids))
+    if not order_ids:
+        return 0
+
+    with transaction.atomic():
+        # Блокировка заказов не даёт двум пересчётам одного заказа
+        # столкнуться на уникальном индексе (order, restaurant)
+        orders = list(
+            Order.objects
+            .filter(id__in=order_ids)
+            .open()
+            .select_for_update()
+            .only('id', 'address', 'restaurant')
+            .order_by('id')
+        )
+        known_coordinates = get_coordinate_cache().get_many(order.address for order in orders)
+        available_restaurant_ids = get_available_restaurants_for_orders(
+            [order for order in orders if not order.restaurant_id]
+        )
+
+        located_orders = [order for order in orders if order.address in known_coordinates]
+        order_restaurant_ids = {
+            order.id: [order.restaurant_id] if order.restaurant_id else available_restaurant_ids[order.id]
+            for order in located_orders
+        }
+        restaurant_coordinates = load_restaurant_coordinates(
+            Restaurant.objects.filter(
+                id__in={
+                    restaurant_id
+                    for restaurant_ids in order_restaurant_ids.values()
+                    for restaurant_id in restaurant_ids
+                },
+                latitude__isnull=False,
+            ).only('id', 'latitude', 'longitude')
+        )
+        restaurant_columns = {
+            restaurant_id: column for column, restaurant_id in enumerate(restaurant_coordinates)
+        }
+
+        # Все расстояния заказ × ресторан считаем одной матрицей
+        matrix = distance_matrix(
+            [known_coordinates[order.address] for order in located_orders],
+            list(restaurant_coordinates.values()),
+        )
+        candidates = []
+        for row, order in enumerate(located_orders):
+            for restaurant_id in order_restaurant_ids[order.id]:
+                if restaurant_id not in restaurant_columns:
+                    continue
+                distance_km = float(matrix[row, restaurant_columns[restaurant_id]])
+                if is_deliverable(distance_km):
+                    candidates.append(OrderCandidate(
+                        order=order, restaurant_id=restaurant_id, distance_km=distance_km,
+                    ))
+
+        old_candidates = defaultdict(set)
+        for order_id, restaurant_id, distance_km in (
+            OrderCandidate.objects
+            .filter(order_id__in=order_ids)
+            .values_list('order_id', 'restaurant_id', 'distance_km')
+        ):
+            old_candidates[order_id].add((restaurant_id, distance_km))
+        new_candidates = defaultdict(set)
+        for candidate in candidates:
+            new_candidates[candidate.order.id].add((candidate.restaurant_id, candidate.distance_km))
+
+        OrderCandidate.objects.filter(order_id__in=order_ids).delete()
+        OrderCandidate.objects.bulk_create(candidates, batch_size=1000)
+        # Лента заказов менеджера отправляет заказ заново, только если сдвинулся updated_at
+        changed_order_ids = [
+            order_id for order_id in order_ids
+            if old_candidates[order_id] != new_candidates[order_id]
+        ]
+        Order.objects.filter(id__in=changed_order_ids).update(updated_at=Now())
+    return len(candidates)
+
+
+def rebuild_order_candidates_on_commit(order_ids):
+    order_ids = list(order_ids)
+    transaction.on_commit(lambda: rebuild_order_candidates(order_ids))
+
+
+def get_reachable_order_ids(orders, restaurant_ids):
+    """Заказы из orders, которые рестораны могут приготовить целиком и доставить."""
+    matches = match_orders_with_restaurants(
+        OrderItem.objects.filter(order__in=orders), restaurant_ids,
+    )
+    matches += match_orders_without_items(orders, restaurant_ids)
+    if not matches:
+        return set()
+    addresses = dict(
+        Order.objects.filter(id__in={order_id for order_id, _ in matches}).values_list('id', 'address')
+    )
+    known_coordinates = get_coordinate_cache().get_many(addresses.values())
+    restaurants = Restaurant.objects.filter(
+        id__in={restaurant_id for _, restaurant_id in matches}, latitude__isnull=False,
+    ).only('id', 'latitude', 'longitude').in_bulk()
+
+    customers_by_restaurant = defaultdict(list)
+    for order_id, restaurant_id in matches:
+        customer_coordinates = known_coordinates.get(addresses[order_id])
+        if customer_coordinates and restaurant_id in restaurants:
+            customers_by_restaurant[restaurant_id].append((order_id, customer_coordinates))
+
+    order_ids = set()
+    for restaurant_id, customers in customers_by_restaurant.items():
+        distances = distance_matrix(
+            [restaurants[restaurant_id].coordinates],
+            [coordinates for _, coordinates in customers],
+        )[0]
+        order_ids.update(
+            order_id
+            for (order_id, _), distance_km in zip(customers, distances)
+            if is_deliverable(distance_km)
+        )
+    return order_ids
+
+
+def refresh_restaurant_candidates(restaurant_ids):
+    """Чинит кандидатов после переезда ресторанов: только заказы, которых он касается."""
+    restaurant_ids = set(restaurant_ids)
+    if not restaurant_ids:
+        return 0
+    open_orders = Order.objects.open()
+    # Заказы, где ресторан уже кандидат: расстояние изменилось или он вышел из радиуса
+    order_ids = set(
+        OrderCandidate.objects
+        .filter(restaurant_id__in=restaurant_ids, order__in=open_orders)
+        .values_list('order_id', flat=True)
+    )
+    order_ids |= set(open_orders.filter(restaurant_id__in=restaurant_ids).values_list('id', flat=True))
+    # Заказы, до которых ресторан теперь дотягивается
+    order_ids |= get_reachable_order_ids(open_orders.filter(restaurant__isnull=True), restaurant_ids)
+    rebuild_order_candidates(order_ids)
+    logger.info(f"Кандидаты пересчитаны для {len(order_ids)} заказов после переезда ресторанов")
+    return len(order_ids)
+
+
+def refresh_menu_item_candidates(restaurant_id, product_id, available):
+    """Чинит кандидатов после изменения доступности товара в ресторане."""
+    # У заказов с назначенным рестораном кандидат один и от меню не зависит
+    orders = Order.objects.open().filter(
+        restaurant__isnull=True, items__product_id=product_id,
+    )
+    if available:
+        order_ids = get_reachable_order_ids(
+            orders.exclude(candidates__restaurant_id=restaurant_id),
+            [restaurant_id],
+        )
+    else:
+        order_ids = set(
+            orders
+            .filter(candidates__restaurant_id=restaurant_id)
+            .values_list('id', flat=True)
+        )
+    rebuild_order_candidates(order_ids)
+    return len(order_ids)
+
+
+def refresh_address_candidates(places):
+    """Пересчитывает кандидатов заказам, чьи адреса только что геокодированы.
+
+    Адрес могли геокодировать повторно, поэтому заказы с кандидатами тоже
+    пересчитываем: расстояния до ресторанов могли измениться.
+    """
+    canonical_keys = {place.canonical_key for place in places}
+    if not canonical_keys:
+        return 0
+    # Адрес заказа мог быть записан иначе, сравниваем канонические ключи
+    order_ids = list(
+        Order.objects.open()
+        .filter(canonical_key__in=canonical_keys)
+        .values_list('id', flat=True)
+    )
+    rebuild_order_candidates(order_ids)
+    return len(order_ids)
+
+
+def prefetch_candidates():
+    """Кандидаты заказов для страницы менеджера: один запрос по индексу (order, distance_km)."""
+    return Prefetch(
+        'candidates',
+        queryset=(
+            OrderCandidate.objects
+            .select_related('restaurant')
+            .only('order', 'distance_km', 'restaurant__name')
+            .order_by('distance_km')
+        ),
+    )
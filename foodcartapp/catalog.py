@@ -0,0 +1,41 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .caching import bump_version
+from .models import Product
+
+CATALOG_VERSION = 'catalog'
+
+
+def dump_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'restaurant': {
+            'id': product.id,
+            'name': product.name,
+        }
+    }
+
+
+def build_catalog():
+    products = Product.objects.select_related('category').available()
+    dumped_products = [dump_product(product) for product in products]
+    return json.dumps(
+        dumped_products, cls=DjangoJSONEncoder, ensure_ascii=False
+    ).encode('utf-8')
+
+
+def invalidate_catalog():
+    # После фиксации: каталог и ETag, собранные до неё, остались бы под новой версией
+    transaction.on_commit(lambda: bump_version(CATALOG_VERSION))
@@ -0,0 +1,242 @@
+import logging
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+
+from .candidates import rebuild_order_candidates
+from .models import Order, OrderCandidate, Restaurant
+from .transitions import start_cooking
+
+logger = logging.getLogger(__name__)
+
+# Заказы, которые занимают кухню ресторана
+KITCHEN_STATUSES = [Order.UNPROCESSING, Order.PROCESSING]
+# Улучшения короче сантиметра не считаем, иначе ошибки округления зацикливают поиск путей
+DISTANCE_EPSILON_KM = 1e-5
+
+
+def assign_greedy(candidates, capacities):
+    """Жадное распределение: пары (заказ, ресторан) по возрастанию расстояния.
+
+    candidates — [(order_id, restaurant_id, distance_km)],
+    capacities — {restaurant_id: свободных мест}. Возвращает {order_id: restaurant_id}.
+    """
+    free = dict(capacities)
+    assignments = {}
+    for order_id, restaurant_id, _ in sorted(candidates, key=lambda candidate: candidate[2]):
+        if order_id in assignments or free.get(restaurant_id, 0) <= 0:
+            continue
+        assignments[order_id] = restaurant_id
+        free[restaurant_id] -= 1
+    return assignments
+
+
+def assign_exact(candidates, capacities):
+    """Точное распределение: наибольшее число заказов с наименьшим суммарным расстоянием.
+
+    Поток минимальной стоимости последовательными кратчайшими путями. Путь
+    ищем не по всему графу, а по ресторанам: ребро r → s — самый дешёвый
+    перенос уже распределённого заказа из r в s, который освобождает место
+    в r. Так каждый шаг — Беллман — Форд на матрице ресторанов в NumPy.
+    """
+    restaurant_ids = sorted({
+        restaurant_id for _, restaurant_id, _ in candidates if capacities.get(restaurant_id, 0) > 0
+    })
+    restaurant_numbers = {restaurant_id: number for number, restaurant_id in enumerate(restaurant_ids)}
+    order_ids = sorted({
+        order_id for order_id, restaurant_id, _ in candidates if restaurant_id in restaurant_numbers
+    })
+    if not order_ids:
+        return {}
+    order_numbers = {order_id: number for number, order_id in enumerate(order_ids)}
+
+    orders_count, restaurants_count = len(order_ids), len(restaurant_ids)
+    all_restaurants = np.arange(restaurants_count)
+    costs = np.full((orders_count, restaurants_count), np.inf)
+    for order_id, restaurant_id, distance_km in candidates:
+        if restaurant_id in restaurant_numbers:
+            costs[order_numbers[order_id], restaurant_numbers[restaurant_id]] = distance_km
+    free = np.array([capacities[restaurant_id] for restaurant_id in restaurant_ids])
+
+    waiting = np.ones(orders_count, dtype=bool)
+    assigned_to = np.full(orders_count, -1)
+    members = [[] for _ in restaurant_ids]
+    # Ждущие заказы по возрастанию расстояния до каждого ресторана: head — первый ещё не распределённый
+    by_distance = np.argsort(costs, axis=0, kind='stable')
+    heads = np.zeros(restaurants_count, dtype=int)
+    moves = np.full((restaurants_count, restaurants_count), np.inf)
+    movers = np.full((restaurants_count, restaurants_count), -1)
+
+    def update_moves(restaurant):
+        if not members[restaurant]:
+            moves[restaurant] = np.inf
+            return
+        rows = np.array(members[restaurant])
+        delta = costs[rows] - costs[rows, restaurant][:, np.newaxis]
+        best = delta.argmin(axis=0)
+        moves[restaurant] = delta[best, all_restaurants]
+        movers[restaurant] = rows[best]
+        moves[restaurant, restaurant] = np.inf
+
+    while True:
+        entering = by_distance[heads, all_restaurants]
+        stale = ~waiting[entering]
+        while stale.any():
+            heads[stale] = np.minimum(heads[stale] + 1, orders_count - 1)
+            entering = by_distance[heads, all_restaurants]
+            stale = ~waiting[entering] & (heads < orders_count - 1)
+        distances = np.where(waiting[entering], costs[entering, all_restaurants], np.inf)
+
+        previous = np.full(restaurants_count, -1)
+        for _ in range(restaurants_count):
+            through = distances[:, np.newaxis] + moves
+            best = through.argmin(axis=0)
+            best_distances = through[best, all_restaurants]
+            improved = best_distances < distances - DISTANCE_EPSILON_KM
+            if not improved.any():
+                break
+            distances = np.where(improved, best_distances, distances)
+            previous = np.where(improved, best, previous)
+
+        reachable = np.where(free > 0, distances, np.inf)
+        target = int(reachable.argmin())
+        if not np.isfinite(reachable[target]):
+            break
+
+        # Вдоль пути каждый ресторан отдаёт заказ следующему и получает новый от предыдущего
+        changed = set()
+        restaurant = target
+        while previous[restaurant] != -1:
+            source = int(previous[restaurant])
+            order = int(movers[source, restaurant])
+            members[source].remove(order)
+            members[restaurant].append(order)
+            assigned_to[order] = restaurant
+            changed.update([source, restaurant])
+            restaurant = source
+        order = int(entering[restaurant])
+        members[restaurant].append(order)
+        assigned_to[order] = restaurant
+        waiting[order] = False
+        changed.add(restaurant)
+        free[target] -= 1
+        for restaurant in changed:
+            update_moves(restaurant)
+
+    return {
+        order_ids[order]: restaurant_ids[restaurant]
+        for order, restaurant in enumerate(assigned_to)
+        if restaurant != -1
+    }
+
+
+DISPATCH_MODES = {
+    'greedy': assign_greedy,
+    'exact': assign_exact,
+}
+
+
+def get_free_capacities(restaurant_ids=None, lock=False):
+    """Свободные места ресторанов {restaurant_id: мест}.
+
+    С lock=True строки ресторанов блокируются до конца транзакции, чтобы
+    два распределения не заняли одни и те же места. FOR NO KEY UPDATE
+    не мешает внешним ключам: кандидатов и заказы ресторанов можно
+    записывать, пока идёт распределение.
+    """
+    restaurants = Restaurant.objects.order_by('id')
+    if restaurant_ids is not None:
+        restaurants = restaurants.filter(id__in=list(restaurant_ids))
+    if lock:
+        restaurants = restaurants.select_for_update(no_key=True)
+    capacities = dict(restaurants.values_list('id', 'capacity'))
+    loads = (
+        Order.objects
+        .filter(status__in=KITCHEN_STATUSES, restaurant_id__in=list(capacities))
+        .values_list('restaurant_id')
+        .annotate(load=Count('id'))
+        .order_by()
+    )
+    for restaurant_id, load in loads:
+        capacities[restaurant_id] -= load
+    return {
+        restaurant_id: capacity
+        for restaurant_id, capacity in capacities.items()
+        if capacity > 0
+    }
+
+
+def apply_assignments(assignments):
+    """Записывает распределение короткой транзакцией, возвращает id назначенных заказов.
+
+    Пока считалось распределение, заказу могли назначить ресторан вручную,
+    а ресторан мог заполниться: такие назначения пропускаем, заказы
+    дождутся следующего прохода.
+    """
+    if not assignments:
+        return []
+    with transaction.atomic():
+        capacities = get_free_capacities(set(assignments.values()), lock=True)
+        # Заказы, которые сейчас правят в админке, пропускаем
+        free_order_ids = (
+            Order.objects
+            .open()
+            .filter(id__in=list(assignments), restaurant__isnull=True)
+            .select_for_update(no_key=True, skip_locked=True)
+            .order_by('registered_at', 'id')
+            .values_list('id', flat=True)
+        )
+        orders_by_restaurant = defaultdict(list)
+        for order_id in free_order_ids:
+            restaurant_id = assignments[order_id]
+            if len(orders_by_restaurant[restaurant_id]) < capacities.get(restaurant_id, 0):
+                orders_by_restaurant[restaurant_id].append(order_id)
+
+        now = timezone.now()
+        assigned_order_ids = []
+        for restaurant_id, order_ids in orders_by_restaurant.items():
+            Order.objects.filter(id__in=order_ids, restaurant__isnull=True).update(
+                restaurant_id=restaurant_id, updated_at=now,
+            )
+            assigned_order_ids.extend(order_ids)
+        start_cooking(assigned_order_ids)
+        # У назначенного заказа единственный кандидат — его ресторан
+        rebuild_order_candidates(assigned_order_ids)
+    return assigned_order_ids
+
+
+def dispatch_orders(mode='greedy', batch_size=5000):
+    """Назначает рестораны открытым заказам без ресторана, возвращает число назначенных.
+
+    Кандидаты берутся из OrderCandidate, старые заказы распределяются первыми.
+    Данные читаются и распределение считается без блокировок, блокировки
+    держит только запись результата (см. apply_assignments).
+    """
+    assign = DISPATCH_MODES[mode]
+    capacities = get_free_capacities()
+    if not capacities:
+        return 0
+    order_ids = list(
+        Order.objects
+        .open()
+        .filter(
+            Exists(OrderCandidate.objects.filter(order=OuterRef('pk'))),
+            restaurant__isnull=True,
+        )
+        .order_by('registered_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not order_ids:
+        return 0
+    candidates = list(
+        OrderCandidate.objects
+        .filter(order_id__in=order_ids)
+        .values_list('order_id', 'restaurant_id', 'distance_km')
+    )
+    assigned_order_ids = apply_assignments(assign(candidates, capacities))
+
+    logger.info(f"Распределено заказов: {len(assigned_order_ids)} из {len(order_ids)} ({mode})")
+    return len(assigned_order_ids)
@@ -0,0 +1,45 @@
+import numpy as np
+from django.conf import settings
+from geopy.distance import distance
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _as_radians(points):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.radians(points[:, 0]), np.radians(points[:, 1])
+
+
+def haversine_matrix(origins, destinations):
+    """Матрица расстояний в км между точками (широта, долгота) за один проход NumPy."""
+    lat1, lon1 = _as_radians(origins)
+    lat2, lon2 = _as_radians(destinations)
+
+    dlat = lat2[np.newaxis, :] - lat1[:, np.newaxis]
+    dlon = lon2[np.newaxis, :] - lon1[:, np.newaxis]
+    a = (
+        np.sin(dlat / 2) ** 2
+        + np.cos(lat1)[:, np.newaxis] * np.cos(lat2)[np.newaxis, :] * np.sin(dlon / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def geodesic_matrix(origins, destinations):
+    """Точная матрица по геодезической на эллипсоиде (geopy), заметно медленнее."""
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    matrix = np.empty((len(origins), len(destinations)))
+    for i, origin in enumerate(origins):
+        for j, destination in enumerate(destinations):
+            matrix[i, j] = distance(origin, destination).km
+    return matrix
+
+
+def distance_matrix(origins, destinations, accurate=None):
+    if accurate is None:
+        accurate = settings.GEODESIC_DISTANCES
+    if not len(origins) or not len(destinations):
+        return np.empty((len(origins), len(destinations)))
+    if accurate:
+        return geodesic_matrix(origins, destinations)
+    return haversine_matrix(origins, destinations)
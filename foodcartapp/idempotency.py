@@ -0,0 +1,116 @@
+import datetime
+import hashlib
+import json
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Запрос с этим ключом идемпотентности ещё обрабатывается.'
+    default_code = 'idempotency_key_in_progress'
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'Ключ идемпотентности уже использован для другого запроса.'
+    default_code = 'idempotency_key_mismatch'
+
+
+def get_request_hash(data):
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_expiration_border():
+    return timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+
+
+def claim_key(key, data):
+    """Закрепляет ключ за запросом.
+
+    Возвращает запись ключа: без ответа — запрос нужно выполнить,
+    с ответом — повтор, отдаём сохранённый ответ. Гонку параллельных
+    повторов разрешает уникальный индекс по ключу.
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        raise serializers.ValidationError({
+            IDEMPOTENCY_HEADER: [f'Ключ не может быть длиннее {MAX_KEY_LENGTH} символов.'],
+        })
+    request_hash = get_request_hash(data)
+
+    # Вторая попытка нужна, если мы удалили просроченную запись
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(key=key, request_hash=request_hash)
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            continue
+        if record.created_at < get_expiration_border():
+            IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            continue
+        if record.request_hash != request_hash:
+            raise IdempotencyKeyMismatch()
+        if record.response_status is not None:
+            return record
+
+        lock_border = timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+        if record.created_at < lock_border:
+            # Обработчик первого запроса, видимо, упал — забираем ключ себе
+            taken_over = IdempotencyKey.objects.filter(
+                pk=record.pk, created_at=record.created_at, response_status__isnull=True,
+            ).update(created_at=timezone.now(), owner_token=uuid.uuid4())
+            if taken_over:
+                logger.warning(f"Ключ идемпотентности {key} перехвачен после таймаута")
+                return IdempotencyKey.objects.get(pk=record.pk)
+        raise IdempotencyKeyInProgress()
+
+    raise IdempotencyKeyInProgress()
+
+
+def save_response(record, response_status, response_body):
+    """Сохраняет ответ; вызывать в той же транзакции, что и запись заказа.
+
+    Если ключ перехватил повтор после таймаута, исключение откатывает
+    транзакцию вместе с заказом: заказ запишет новый владелец ключа.
+    """
+    # Условный UPDATE блокирует строку ключа до конца транзакции,
+    # поэтому перехват не пройдёт, пока заказ не записан
+    saved = IdempotencyKey.objects.filter(
+        pk=record.pk, owner_token=record.owner_token, response_status__isnull=True,
+    ).update(response_status=response_status, response_body=response_body)
+    if not saved:
+        logger.warning(f"Ключ идемпотентности {record.key} перехвачен, ответ не сохранён")
+        raise IdempotencyKeyInProgress()
+    record.response_status = response_status
+    record.response_body = response_body
+
+
+def release_key(record):
+    """Освобождает ключ, если запрос не удался, чтобы клиент мог повторить его."""
+    IdempotencyKey.objects.filter(
+        pk=record.pk, owner_token=record.owner_token, response_status__isnull=True,
+    ).delete()
+
+
+def delete_expired_keys():
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=get_expiration_border()).delete()
+    return deleted
@@ -0,0 +1,71 @@
+import logging
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OrderIntake
+from .serializers import create_orders, validate_orders
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_order(payload):
+    """Кладёт проверенные данные заказа в очередь; заказ создаст drain_order_intake."""
+    return OrderIntake.objects.create(payload=payload)
+
+
+def process_intakes(intakes):
+    """Создаёт заказы по заявкам и проставляет заявкам статусы, пока без записи заявок."""
+    # Товары могли удалить из каталога, пока заявка ждала, поэтому проверяем заново
+    validated_orders, errors = validate_orders([intake.payload for intake in intakes])
+    orders = create_orders(validated_data for _, validated_data in validated_orders)
+
+    for (number, _), order in zip(validated_orders, orders):
+        intakes[number].order = order
+        intakes[number].status = OrderIntake.CREATED
+        intakes[number].errors = None
+    for number, order_errors in errors.items():
+        intakes[number].order = None
+        intakes[number].errors = order_errors
+        intakes[number].status = OrderIntake.REJECTED
+        logger.warning(f"Заявка {intakes[number].tracking_id} отклонена: {order_errors}")
+
+
+def drain_intake(batch_size=500):
+    """Превращает пачку заявок из очереди в заказы, возвращает число обработанных заявок.
+
+    Заявки блокируются с SKIP LOCKED, поэтому несколько воркеров
+    разбирают очередь параллельно, не мешая друг другу. Если пачка
+    не записалась целиком, заявки разбираются по одной в своих точках
+    сохранения, а сломанные помечаются FAILED и не держат очередь.
+    """
+    with transaction.atomic():
+        intakes = list(
+            OrderIntake.objects
+            .filter(status=OrderIntake.PENDING)
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        )
+        if not intakes:
+            return 0
+
+        try:
+            with transaction.atomic():
+                process_intakes(intakes)
+        except Exception:
+            logger.exception("Пачка заявок не записалась, разбираем заявки по одной")
+            for intake in intakes:
+                try:
+                    with transaction.atomic():
+                        process_intakes([intake])
+                except Exception as e:
+                    intake.order = None
+                    intake.errors = {'detail': f'{e.__class__.__name__}: {e}'}
+                    intake.status = OrderIntake.FAILED
+                    logger.exception(f"Заявка {intake.tracking_id} не обработана")
+
+        processed_at = timezone.now()
+        for intake in intakes:
+            intake.processed_at = processed_at
+        OrderIntake.objects.bulk_update(intakes, ['order', 'status', 'errors', 'processed_at'])
+    return len(intakes)
@@ -0,0 +1,53 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import DISPATCH_MODES
+from foodcartapp.distances import haversine_matrix
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает режимы распределения заказов по ресторанам на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--restaurants', type=int, default=300)
+        parser.add_argument('--capacity', type=int, default=15)
+        parser.add_argument('--radius', type=float, default=settings.DELIVERY_RADIUS_KM or 50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        # Точки в пределах Москвы и области
+        center = np.array([55.75, 37.62])
+        orders = center + rng.uniform(-0.5, 0.5, size=(options['orders'], 2))
+        restaurants = center + rng.uniform(-0.5, 0.5, size=(options['restaurants'], 2))
+
+        distances = haversine_matrix(orders, restaurants)
+        # Каждый ресторан готовит не всё меню: кандидат — ресторан в радиусе с нужными товарами
+        suitable = (distances <= options['radius']) & (rng.random(distances.shape) < 0.5)
+        order_numbers, restaurant_numbers = np.nonzero(suitable)
+        candidates = list(zip(
+            order_numbers.tolist(), restaurant_numbers.tolist(),
+            distances[order_numbers, restaurant_numbers].tolist(),
+        ))
+        capacities = {
+            restaurant: int(capacity)
+            for restaurant, capacity in enumerate(rng.integers(1, 2 * options['capacity'], len(restaurants)))
+        }
+        self.stdout.write(
+            f'Заказов {len(orders)}, ресторанов {len(restaurants)}, '
+            f'мест {sum(capacities.values())}, кандидатов {len(candidates)}'
+        )
+
+        for mode, assign in DISPATCH_MODES.items():
+            started_at = time.perf_counter()
+            assignments = assign(candidates, capacities)
+            elapsed = time.perf_counter() - started_at
+            total_km = sum(distances[order, restaurant] for order, restaurant in assignments.items())
+            self.stdout.write(
+                f'{mode}: {elapsed * 1000:.0f} мс, назначено {len(assignments)}, '
+                f'суммарно {total_km:.0f} км, в среднем {total_km / max(len(assignments), 1):.2f} км'
+            )
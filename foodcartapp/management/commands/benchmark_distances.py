@@ -0,0 +1,40 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from foodcartapp.distances import geodesic_matrix, haversine_matrix
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость и точность расчёта матрицы расстояний на синтетических данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--restaurants', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        # Точки в пределах Москвы и области
+        center = np.array([55.75, 37.62])
+        orders = center + rng.uniform(-0.5, 0.5, size=(options['orders'], 2))
+        restaurants = center + rng.uniform(-0.5, 0.5, size=(options['restaurants'], 2))
+
+        started_at = time.perf_counter()
+        haversine = haversine_matrix(orders, restaurants)
+        haversine_time = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        geodesic = geodesic_matrix(orders, restaurants)
+        geodesic_time = time.perf_counter() - started_at
+
+        error = np.abs(haversine - geodesic)
+        self.stdout.write(f'Матрица {len(orders)} × {len(restaurants)}')
+        self.stdout.write(f'haversine (NumPy): {haversine_time * 1000:.1f} мс')
+        self.stdout.write(f'geodesic (geopy): {geodesic_time * 1000:.1f} мс')
+        self.stdout.write(f'Ускорение: {geodesic_time / haversine_time:.0f}×')
+        self.stdout.write(
+            f'Расхождение: среднее {error.mean() * 1000:.1f} м, '
+            f'максимальное {error.max() * 1000:.1f} м'
+        )
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.dispatch import DISPATCH_MODES, dispatch_orders
+
+
+class Command(BaseCommand):
+    help = 'Назначает рестораны открытым заказам с учётом вместимости ресторанов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=list(DISPATCH_MODES), default='greedy',
+            help='greedy — ближайший свободный ресторан, exact — минимум суммарного расстояния',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько заказов распределять за один проход',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=30,
+            help='Пауза в секундах между проходами',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Распределить заказы один раз и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            assigned = dispatch_orders(options['mode'], options['batch_size'])
+            if assigned:
+                self.stdout.write(f'Назначено заказов: {assigned}')
+            if options['once']:
+                break
+            time.sleep(options['interval'])
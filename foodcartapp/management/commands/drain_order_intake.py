@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.intake import drain_intake
+
+
+class Command(BaseCommand):
+    help = 'Создаёт заказы из очереди, принятой в режиме ORDER_INTAKE_MODE'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько заявок превращать в заказы за один проход',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1,
+            help='Пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать очередь один раз и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = drain_intake(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Обработано заявок: {processed}')
+            if options['once']:
+                break
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
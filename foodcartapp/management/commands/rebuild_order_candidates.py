@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import rebuild_order_candidates
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет рестораны-кандидаты всех открытых заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько заказов пересчитывать за одну транзакцию',
+        )
+
+    def handle(self, *args, **options):
+        order_ids = list(Order.objects.open().order_by('id').values_list('id', flat=True))
+        candidates = 0
+        for start in range(0, len(order_ids), options['batch_size']):
+            candidates += rebuild_order_candidates(order_ids[start:start + options['batch_size']])
+        self.stdout.write(f'Заказов: {len(order_ids)}, кандидатов: {candidates}')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сохранённую стоимость заказов по их позициям'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только проверить расхождения, ничего не записывая',
+        )
+
+    def handle(self, *args, **options):
+        mismatched_orders = (
+            Order.objects
+            .with_calculated_total()
+            .exclude(total_price=F('calculated_total'))
+        )
+        mismatched_ids = list(mismatched_orders.values_list('id', flat=True))
+
+        if options['verify']:
+            for order in mismatched_orders:
+                self.stdout.write(
+                    f'Заказ {order.id}: сохранено {order.total_price}, по позициям {order.calculated_total}'
+                )
+            self.stdout.write(f'Заказов с расхождениями: {len(mismatched_ids)}')
+            return
+
+        updated = Order.objects.filter(id__in=mismatched_ids).update_total_price()
+        self.stdout.write(f'Пересчитано заказов: {updated}')
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:35
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0050_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderIntake',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tracking_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True, verbose_name='номер для отслеживания')),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='данные заказа')),
+                ('status', models.CharField(choices=[('pnd', 'В очереди'), ('crt', 'Заказ создан'), ('err', 'Заказ отклонён')], db_index=True, default='pnd', max_length=3, verbose_name='статус')),
+                ('errors', models.JSONField(blank=True, null=True, verbose_name='ошибки')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='принят')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='обработан')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='intake', to='foodcartapp.order', verbose_name='заказ')),
+            ],
+            options={
+                'verbose_name': 'заказ в очереди',
+                'verbose_name_plural': 'очередь заказов',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations, models
+
+from places.migrations._frozen_normalization import normalize_address
+
+
+def fill_restaurant_coordinates(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    Place = apps.get_model('places', 'Place')
+    coordinates = {
+        canonical_key: (latitude, longitude)
+        for canonical_key, latitude, longitude in Place.objects.filter(status='fnd')
+        .values_list('canonical_key', 'latitude', 'longitude')
+    }
+    restaurants = []
+    for restaurant in Restaurant.objects.all():
+        key = normalize_address(restaurant.address)
+        if key in coordinates:
+            restaurant.latitude, restaurant.longitude = coordinates[key]
+            restaurants.append(restaurant)
+    Restaurant.objects.bulk_update(restaurants, ['latitude', 'longitude'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0051_orderintake'),
+        ('places', '0004_place_canonical_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True, verbose_name='широта'),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, editable=False, max_digits=9, null=True, verbose_name='долгота'),
+        ),
+        migrations.RunPython(fill_restaurant_coordinates, migrations.RunPython.noop),
+    ]
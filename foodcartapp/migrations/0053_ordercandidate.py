@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0052_restaurant_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.FloatField(verbose_name='расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='foodcartapp.order', verbose_name='заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'ресторан-кандидат',
+                'verbose_name_plural': 'рестораны-кандидаты',
+                'indexes': [models.Index(fields=['order', 'distance_km'], name='order_candidate_distance_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'restaurant'), name='unique_order_candidate')],
+            },
+        ),
+    ]
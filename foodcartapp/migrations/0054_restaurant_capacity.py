@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0053_ordercandidate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='capacity',
+            field=models.PositiveIntegerField(default=20, help_text='Сколько заказов ресторан готовит одновременно, учитывается при автоматическом распределении', verbose_name='одновременных заказов'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def start_cooking_assigned_orders(apps, schema_editor):
+    # Раньше такие заказы переводила в «Готовится» страница заказов при просмотре
+    Order = apps.get_model('foodcartapp', 'Order')
+    Order.objects.filter(status='new', restaurant__isnull=False).update(
+        status='prc', updated_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0054_restaurant_capacity'),
+    ]
+
+    operations = [
+        migrations.RunPython(start_cooking_assigned_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+from places.migrations._frozen_normalization import normalize_address
+
+
+def fill_order_canonical_keys(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    orders = []
+    for order in Order.objects.only('id', 'address').iterator(chunk_size=2000):
+        order.canonical_key = normalize_address(order.address)
+        orders.append(order)
+        if len(orders) >= 2000:
+            Order.objects.bulk_update(orders, ['canonical_key'])
+            orders = []
+    Order.objects.bulk_update(orders, ['canonical_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0055_start_cooking_assigned_orders'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='canonical_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200, verbose_name='Канонический адрес'),
+        ),
+        migrations.RunPython(fill_order_canonical_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+
+from places.migrations._frozen_normalization import normalize_address
+
+
+def fill_restaurant_canonical_keys(apps, schema_editor):
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    restaurants = []
+    for restaurant in Restaurant.objects.only('id', 'address'):
+        restaurant.canonical_key = normalize_address(restaurant.address)
+        restaurants.append(restaurant)
+    Restaurant.objects.bulk_update(restaurants, ['canonical_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_order_canonical_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='canonical_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=200, verbose_name='канонический адрес'),
+        ),
+        migrations.RunPython(fill_restaurant_canonical_keys, migrations.RunPython.noop),
+    ]
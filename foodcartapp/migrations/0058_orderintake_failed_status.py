@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_restaurant_canonical_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderintake',
+            name='status',
+            field=models.CharField(choices=[('pnd', 'В очереди'), ('crt', 'Заказ создан'), ('err', 'Заказ отклонён'), ('fld', 'Ошибка при создании заказа')], db_index=True, default='pnd', max_length=3, verbose_name='статус'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:14
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0058_orderintake_failed_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='owner_token',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, help_text='Меняется, когда ключ перехватывают после таймаута', verbose_name='владелец'),
+        ),
+    ]
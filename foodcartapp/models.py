@@ -1,9 +1,15 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 
 from phonenumber_field.modelfields import PhoneNumberField
-from django.db.models import Sum, F
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+
+from places.normalization import normalize_address
 
 
 class Restaurant(models.Model):
@@ -16,11 +22,39 @@ class Restaurant(models.Model):
         max_length=100,
         blank=True,
     )
+    canonical_key = models.CharField(
+        'канонический адрес',
+        max_length=200,
+        db_index=True,
+        editable=False,
+        blank=True,
+    )
     contact_phone = models.CharField(
         'контактный телефон',
         max_length=50,
         blank=True,
     )
+    latitude = models.DecimalField(
+        'широта',
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    longitude = models.DecimalField(
+        'долгота',
+        max_digits=9,
+        decimal_places=6,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    capacity = models.PositiveIntegerField(
+        'одновременных заказов',
+        default=20,
+        help_text='Сколько заказов ресторан готовит одновременно, учитывается при автоматическом распределении',
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -29,6 +63,19 @@ class Restaurant(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.canonical_key = normalize_address(self.address)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'address' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'canonical_key'}
+        super().save(*args, **kwargs)
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
 
 class ProductQuerySet(models.QuerySet):
     def available(self):
@@ -127,14 +174,37 @@ class RestaurantMenuItem(models.Model):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
-class OrderManager(models.Manager):
-    def get_total_price(self):
+class OrderQuerySet(models.QuerySet):
+    def open(self):
+        return self.exclude(status__in=[self.model.ORDER_CLOSED, self.model.ORDER_CANCELED])
+
+    def with_calculated_total(self):
+        # Стоимость по позициям заказа, для сверки с сохранённой total_price
         return self.annotate(
-            total_price=models.Sum(
-                F('items__price') * F('items__quantity')
+            calculated_total=Coalesce(
+                Sum(F('items__price') * F('items__quantity')),
+                Value(0),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
             )
         )
 
+    def update_total_price(self):
+        items_total = (
+            OrderItem.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('price') * F('quantity')))
+            .values('total')
+        )
+        return self.update(
+            total_price=Coalesce(
+                Subquery(items_total),
+                Value(0),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+            updated_at=Now(),
+        )
+
 
 class Order(models.Model):
     UNPROCESSING = 'new'
@@ -155,7 +225,7 @@ class Order(models.Model):
         ('cash', 'Наличные'),
     ]
 
-    objects = OrderManager()
+    objects = OrderQuerySet.as_manager()
 
     firstname = models.CharField(
         verbose_name='Имя',
@@ -176,6 +246,14 @@ class Order(models.Model):
         'Адрес доставки',
         max_length=120
     )
+    # Ключ для поиска заказов по геокодированному месту, см. places.normalization
+    canonical_key = models.CharField(
+        verbose_name='Канонический адрес',
+        max_length=200,
+        db_index=True,
+        editable=False,
+        blank=True,
+    )
 
     payment_method = models.CharField(
         verbose_name="Способ оплаты",
@@ -189,6 +267,10 @@ class Order(models.Model):
         verbose_name='Cоздан', default=timezone.now, db_index=True
     )
 
+    updated_at = models.DateTimeField(
+        verbose_name='Изменён', auto_now=True
+    )
+
     called_at = models.DateTimeField(
         verbose_name='Время звонка', null=True, blank=True, db_index=True
     )
@@ -218,15 +300,36 @@ class Order(models.Model):
         blank=True,
         null=True,
     )
-    price = OrderManager()
+
+    total_price = models.DecimalField(
+        verbose_name='Стоимость заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'заказчик'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            # Ключ постраничного вывода заказов в кабинете менеджера
+            models.Index(fields=['status', 'registered_at', 'id'], name='order_dashboard_idx'),
+            # Курсор ленты изменений заказов
+            models.Index(fields=['updated_at', 'id'], name='order_feed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.firstname} {self.lastname} {self.address}"
 
+    def save(self, *args, **kwargs):
+        self.canonical_key = normalize_address(self.address)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'address' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'canonical_key'}
+        super().save(*args, **kwargs)
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(
@@ -261,3 +364,137 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"OrderItem {self.product}: {self.quantity}"
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(
+        Order,
+        related_name='candidates',
+        verbose_name='заказ',
+        on_delete=models.CASCADE,
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        related_name='order_candidates',
+        verbose_name='ресторан',
+        on_delete=models.CASCADE,
+    )
+    distance_km = models.FloatField(
+        'расстояние, км',
+    )
+
+    class Meta:
+        verbose_name = 'ресторан-кандидат'
+        verbose_name_plural = 'рестораны-кандидаты'
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'restaurant'], name='unique_order_candidate'),
+        ]
+        indexes = [
+            # Кандидаты заказа сразу в порядке удалённости
+            models.Index(fields=['order', 'distance_km'], name='order_candidate_distance_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.order_id} → {self.restaurant_id}: {self.distance_km:.2f} км"
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(
+        'ключ',
+        max_length=255,
+        unique=True,
+    )
+    request_hash = models.CharField(
+        'хеш запроса',
+        max_length=64,
+    )
+    owner_token = models.UUIDField(
+        'владелец',
+        default=uuid.uuid4,
+        editable=False,
+        help_text='Меняется, когда ключ перехватывают после таймаута',
+    )
+    response_status = models.PositiveSmallIntegerField(
+        'код ответа',
+        null=True,
+        blank=True,
+    )
+    response_body = models.JSONField(
+        'тело ответа',
+        encoder=DjangoJSONEncoder,
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        'создан',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
+
+
+class OrderIntake(models.Model):
+    PENDING = 'pnd'
+    CREATED = 'crt'
+    REJECTED = 'err'
+    FAILED = 'fld'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (CREATED, 'Заказ создан'),
+        (REJECTED, 'Заказ отклонён'),
+        (FAILED, 'Ошибка при создании заказа'),
+    ]
+
+    tracking_id = models.UUIDField(
+        'номер для отслеживания',
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+    )
+    payload = models.JSONField(
+        'данные заказа',
+        encoder=DjangoJSONEncoder,
+    )
+    status = models.CharField(
+        'статус',
+        max_length=3,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True,
+    )
+    order = models.OneToOneField(
+        Order,
+        verbose_name='заказ',
+        related_name='intake',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    errors = models.JSONField(
+        'ошибки',
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        'принят',
+        default=timezone.now,
+        db_index=True,
+    )
+    processed_at = models.DateTimeField(
+        'обработан',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'заказ в очереди'
+        verbose_name_plural = 'очередь заказов'
+
+    def __str__(self):
+        return str(self.tracking_id)
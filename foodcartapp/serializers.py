@@ -1,24 +1,66 @@
 import logging
 
-from django.conf import settings
-from django.db.models import Count, Q
-from django.utils import timezone
-
-from geopy.distance import distance
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
-from places.models import Place
-from places.views import fetch_coordinates
-from .models import Order, OrderItem, Restaurant
+from places.normalization import normalize_address
+from places.touches import touch_addresses
+from .candidates import rebuild_order_candidates_on_commit
+from .models import Order, OrderItem, Product
 
 logger = logging.getLogger(__name__)
 
 
+class PrefetchedProductField(serializers.PrimaryKeyRelatedField):
+    """Товар позиции заказа из заранее загруженного словаря вместо SELECT на позицию."""
+
+    prefetched_products = None
+
+    def to_internal_value(self, data):
+        if self.prefetched_products is None or isinstance(data, bool):
+            return super().to_internal_value(data)
+        try:
+            product_id = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if product_id not in self.prefetched_products:
+            self.fail('does_not_exist', pk_value=data)
+        return self.prefetched_products[product_id]
+
+
+def collect_product_ids(items):
+    product_ids = set()
+    for item in items:
+        try:
+            product_ids.add(int(item['product']))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return product_ids
+
+
+def prefetch_products(product_ids):
+    return Product.objects.only('id', 'name', 'price').in_bulk(product_ids)
+
+
+class OrderItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            # Товары можно передать через контекст сразу для пачки заказов,
+            # иначе загружаем все товары заказа одним запросом
+            prefetched_products = self.context.get('prefetched_products')
+            if prefetched_products is None:
+                prefetched_products = prefetch_products(collect_product_ids(data))
+            self.child.fields['product'].prefetched_products = prefetched_products
+        return super().to_internal_value(data)
+
+
 class OrderItemSerializer(ModelSerializer):
+    product = PrefetchedProductField(queryset=Product.objects.all())
+
     class Meta:
         model = OrderItem
         fields = ['product', 'quantity']
+        list_serializer_class = OrderItemListSerializer
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -29,143 +71,102 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['firstname', 'lastname', 'phonenumber', 'address', 'products']
 
     def create(self, validated_data):
-        # Извлекаем продукты из validated_data, чтобы передать их отдельно
-        products_data = validated_data.pop('products')
-
-        # Используем super() для создания объекта Order без поля 'products'
-        order = super(OrderSerializer, self).create(validated_data)
-
-        # Создаем элементы заказа (OrderItem) с привязкой к заказу
-        order_items = []
-        for product_data in products_data:
-            product = product_data['product']
-            price = product.price  # Получаем цену из модели Product
-            order_item = OrderItem(order=order, price=price, **product_data)
-            order_items.append(order_item)
+        order, order_items = build_order(validated_data)
+        order.save()
 
         # Создаем все элементы заказа за один запрос
         OrderItem.objects.bulk_create(order_items)
 
-        # Обновляем или создаем Place (адрес)
-        try:
-            Place.objects.update_or_create(
-                address=order.address, defaults={"create_date": timezone.now()}
-            )
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении или создании места для адреса {order.address}: {str(e)}")
+        # Адрес отмечаем в буфере: новые адреса попадут в очередь фонового
+        # геокодирования пачкой (см. places/touches.py и geocode_worker)
+        touch_addresses([order.address])
+        rebuild_order_candidates_on_commit([order.id])
 
         return order
 
 
-def update_or_create_place(address):
-    place, created = Place.objects.get_or_create(address=address)
-    if created or not place.latitude or not place.longitude:
-        location = fetch_coordinates(settings.YANDEX_GEOCODER_API_KEY, address)
-        if location:
-            longitude, latitude = location
-            place.longitude = longitude
-            place.latitude = latitude
-            place.save()
-        else:
-            logger.warning(f"Не удалось получить координаты для адреса {address} из API")
-    else:
-        logger.info(f"Координаты для адреса {address} загружены из базы данных")
-
-
-def get_coordinates(address, place_map, api_key):
-    place = place_map.get(address)
-    if place and place.latitude and place.longitude:
-        return place.latitude, place.longitude
-    else:
-        update_or_create_place(address)
-        place = place_map.get(address)
-        return (place.latitude, place.longitude) if place else None
-
-
-def process_restaurants(restaurants, place_map, api_key):
-    restaurant_coordinates = {}
-    for restaurant in restaurants:
-        coordinates = get_coordinates(restaurant.address, place_map, api_key)
-        if coordinates:
-            restaurant_coordinates[restaurant.id] = coordinates
-        else:
-            logger.warning(f"Не удалось получить координаты для ресторана {restaurant.name} из API")
-    return restaurant_coordinates
-
-
-def get_available_restaurants(order):
-    if order.restaurant:
-        return [order.restaurant]
-    else:
-        # Если ресторан не выбран, ищем подходящие рестораны
-        product_ids = order.items.values_list('product_id', flat=True)
-        return Restaurant.objects.annotate(
-            num_matching_products=Count(
-                'menu_items',
-                filter=Q(menu_items__product_id__in=product_ids) & Q(menu_items__availability=True)
-            )
-        ).filter(num_matching_products=len(product_ids)).distinct() if product_ids else Restaurant.objects.all()
-
-
-def process_orders(orders, restaurant_coordinates, place_map, api_key):
+def build_order(validated_data):
+    """Заказ и его позиции по проверенным данным, пока без записи в базу."""
+    # Извлекаем продукты из validated_data, чтобы передать их отдельно
+    validated_data = dict(validated_data)
+    products_data = validated_data.pop('products')
+
+    # Стоимость заказа храним в самом заказе, чтобы не считать её при каждом чтении
+    validated_data['total_price'] = sum(
+        product_data['product'].price * product_data['quantity']
+        for product_data in products_data
+    )
+    order = Order(**validated_data)
+    # bulk_create не вызывает save(), ключ адреса заполняем сами
+    order.canonical_key = normalize_address(order.address)
+
+    order_items = []
+    for product_data in products_data:
+        product = product_data['product']
+        price = product.price  # Цена из товара, загруженного при валидации
+        order_items.append(OrderItem(order=order, price=price, **product_data))
+    return order, order_items
+
+
+def validate_orders(orders_data):
+    """Проверяет пачку заказов: [(номер, данные заказа)] и {номер: ошибки}."""
+    # Товары всех заказов пачки загружаем одним запросом
+    product_ids = set()
+    for order_data in orders_data:
+        if isinstance(order_data, dict) and isinstance(order_data.get('products'), list):
+            product_ids |= collect_product_ids(order_data['products'])
+    context = {'prefetched_products': prefetch_products(product_ids)}
+
+    # Один экземпляр сериализатора на пачку, как в ListSerializer: поля модели
+    # разбираются один раз, а не для каждого заказа
+    serializer = OrderSerializer(context=context)
+    validated_orders = []
+    errors = {}
+    for number, order_data in enumerate(orders_data):
+        try:
+            validated_orders.append((number, serializer.run_validation(order_data)))
+        except serializers.ValidationError as e:
+            errors[number] = e.detail
+    return validated_orders, errors
+
+
+def create_orders(validated_orders, batch_size=1000):
+    """Записывает пачку проверенных заказов несколькими INSERT; вызывать в транзакции."""
+    orders = []
+    order_items = []
+    for validated_data in validated_orders:
+        order, items = build_order(validated_data)
+        orders.append(order)
+        order_items.extend(items)
+
+    Order.objects.bulk_create(orders, batch_size=batch_size)
+    # Первичные ключи заказов уже известны, позиции привяжутся к ним при записи
+    OrderItem.objects.bulk_create(order_items, batch_size=batch_size)
+    touch_addresses(order.address for order in orders)
+    rebuild_order_candidates_on_commit(order.id for order in orders)
+    return orders
+
+
+def process_orders(orders):
+    """Расстояния до ресторанов-кандидатов для страницы менеджера, только чтение.
+
+    Статусы здесь не меняются: заказ переводит в «Готовится» transitions.py
+    в момент назначения ресторана.
+    """
     available_restaurants_data = []
-    orders_to_update = []  # Список для сбора заказов, которые нужно обновить
 
     for order in orders:
-        restaurant_distances = []
-        customer_coordinates = get_coordinates(order.address, place_map, api_key)
-        if customer_coordinates:
-            available_restaurants = get_available_restaurants(order)
-            for restaurant in available_restaurants:
-                if restaurant.id in restaurant_coordinates:
-                    restaurant_distance_value = round(distance(
-                        customer_coordinates,
-                        restaurant_coordinates[restaurant.id]).km, 2)
-                    restaurant_distances.append({
-                        'name': restaurant.name,
-                        'distance': restaurant_distance_value
-                    })
-                else:
-                    logger.warning(f"Предупреждение: Нет координат для ресторана {restaurant.name}")
-            restaurant_distances.sort(key=lambda x: x['distance'])
-            order.restaurant_distances = restaurant_distances
-
-            # Проверяем, нужно ли обновить статус заказа
-            if order.restaurant and order.status != Order.PROCESSING:
-                order.status = Order.PROCESSING
-                orders_to_update.append(order)
-
+        # Кандидатов заранее записывает candidates.py, здесь только читаем
+        # их из prefetch_candidates() уже отсортированными по расстоянию
+        restaurant_distances = [
+            {
+                'name': candidate.restaurant.name,
+                'distance': round(candidate.distance_km, 2),
+            }
+            for candidate in order.candidates.all()
+        ]
+        order.restaurant_distances = restaurant_distances
         available_restaurants_data.append((order.id, restaurant_distances))
 
-    # После цикла, массовое обновление статуса
-    if orders_to_update:
-        Order.objects.bulk_update(orders_to_update, ['status'])
-
     return available_restaurants_data
 
-
-def load_coordinates(addresses):
-    place_map = {place.address: place for place in Place.objects.filter(address__in=addresses)}
-    updated_places = []
-
-    for address in addresses:
-        update_or_create_place(address)
-        place = place_map.get(address)
-        if place:
-            updated_places.append(place)
-
-    return place_map, updated_places
-
-
-def update_coordinates_on_address_change(instance, new_address):
-    if instance.address != new_address:
-        update_or_create_place(new_address)
-        place = Place.objects.get(address=new_address)
-        if place:
-            instance.address = new_address
-            instance.longitude = place.longitude
-            instance.latitude = place.latitude
-            instance.save()
-            logger.info(f"Координаты для адреса {new_address} обновлены")
-        else:
-            logger.warning(f"Не удалось обновить координаты для нового адреса {new_address}")
@@ -0,0 +1,83 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from places.cache import get_coordinate_cache
+from places.models import Place
+from .availability import invalidate_availability_index
+from .candidates import (
+    refresh_address_candidates, refresh_menu_item_candidates, refresh_restaurant_candidates,
+)
+from .catalog import invalidate_catalog
+from .models import Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .spatial import refresh_restaurant, sync_restaurant_coordinates, update_coordinates_on_address_change
+
+
+@receiver(pre_save, sender=Restaurant)
+def update_restaurant_coordinates(sender, instance, **kwargs):
+    old_address = None
+    if instance.pk:
+        old_address = Restaurant.objects.filter(pk=instance.pk).values_list('address', flat=True).first()
+    instance._coordinates_changed = update_coordinates_on_address_change(instance, old_address)
+
+
+@receiver(post_save, sender=Restaurant)
+def update_restaurant_location(sender, instance, created, **kwargs):
+    # Индекс других процессов перестроится по версии, её меняем только после фиксации
+    transaction.on_commit(lambda: refresh_restaurant(instance))
+    # В индексе доступности лежат сами рестораны, название могли поменять
+    invalidate_availability_index()
+    if created:
+        invalidate_catalog()
+    # Новый ресторан сразу подходит заказам без позиций
+    if getattr(instance, '_coordinates_changed', False):
+        transaction.on_commit(lambda: refresh_restaurant_candidates([instance.pk]))
+
+
+@receiver(post_delete, sender=Restaurant)
+def remove_restaurant_location(sender, instance, **kwargs):
+    transaction.on_commit(lambda: refresh_restaurant(instance, deleted=True))
+    invalidate_availability_index()
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_menu_availability(sender, instance, signal, **kwargs):
+    invalidate_availability_index()
+    invalidate_catalog()
+    # Удалённый пункт меню для заказов то же, что недоступный товар
+    available = signal is post_save and instance.availability
+    transaction.on_commit(lambda: refresh_menu_item_candidates(
+        instance.restaurant_id, instance.product_id, available,
+    ))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def update_catalog(sender, instance, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_save, sender=Place)
+def update_geocoded_restaurants(sender, instance, update_fields=None, **kwargs):
+    # Касания адресов при оформлении заказов координаты не меняют
+    if update_fields is not None and not {'latitude', 'status'} & set(update_fields):
+        return
+    # Кэш обновляем после фиксации, чтобы не раздать координаты откатившейся транзакции
+    transaction.on_commit(lambda: get_coordinate_cache().update([instance]))
+    if instance.status == Place.RESOLVED:
+        transaction.on_commit(lambda: refresh_geocoded_place(instance))
+
+
+def refresh_geocoded_place(place):
+    moved_restaurants = sync_restaurant_coordinates([place])
+    refresh_restaurant_candidates(restaurant.id for restaurant in moved_restaurants)
+    refresh_address_candidates([place])
+
+
+@receiver(post_delete, sender=Place)
+def forget_place_coordinates(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_coordinate_cache().forget([instance.canonical_key]))
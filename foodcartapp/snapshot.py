@@ -0,0 +1,197 @@
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from .caching import get_version, is_cache_shared
+from .catalog import CATALOG_VERSION, build_catalog
+from .models import Product, Restaurant, RestaurantMenuItem
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка файла недоступна, dev-сервер обходится без неё
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SBCS'
+FORMAT_VERSION = 1
+# magic, формат, версия каталога, число товаров, ресторанов, длина JSON каталога
+HEADER = struct.Struct('<4sIQIII4x')
+
+
+class CatalogSnapshot:
+    """Снимок каталога и матрицы доступности товаров в ресторанах.
+
+    Массивы — представления NumPy поверх отображённого в память файла,
+    поэтому все воркеры на сервере читают одни и те же страницы памяти.
+    """
+
+    def __init__(self, buffer):
+        magic, format_version, version, products_count, restaurants_count, catalog_size = (
+            HEADER.unpack_from(buffer)
+        )
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError('Неизвестный формат снимка каталога')
+        self.version = version
+
+        offset = HEADER.size
+        self.product_ids = np.frombuffer(buffer, dtype='<i8', count=products_count, offset=offset)
+        offset += self.product_ids.nbytes
+        self.restaurant_ids = np.frombuffer(buffer, dtype='<i8', count=restaurants_count, offset=offset)
+        offset += self.restaurant_ids.nbytes
+        row_size = (restaurants_count + 7) // 8
+        self.availability = np.frombuffer(
+            buffer, dtype=np.uint8, count=products_count * row_size, offset=offset
+        ).reshape(products_count, row_size)
+        offset += self.availability.nbytes
+        self.catalog_json = memoryview(buffer)[offset:offset + catalog_size]
+
+    def _product_row(self, product_id):
+        row = int(np.searchsorted(self.product_ids, product_id))
+        if row < len(self.product_ids) and self.product_ids[row] == product_id:
+            return row
+        return None
+
+    def is_available(self, product_id):
+        """Продаётся ли товар хотя бы в одном ресторане."""
+        row = self._product_row(product_id)
+        return row is not None and bool(self.availability[row].any())
+
+    def get_availability(self, product_id, restaurant_ids):
+        row = self._product_row(product_id)
+        if row is None:
+            return [False] * len(restaurant_ids)
+        available = np.unpackbits(self.availability[row], count=len(self.restaurant_ids)).astype(bool)
+        columns = np.searchsorted(self.restaurant_ids, restaurant_ids)
+        return [
+            column < len(self.restaurant_ids)
+            and self.restaurant_ids[column] == restaurant_id
+            and bool(available[column])
+            for restaurant_id, column in zip(restaurant_ids, columns)
+        ]
+
+
+def build_snapshot(version):
+    """Содержимое снимка каталога версии version."""
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            # Все чтения снимка видят одно и то же состояние базы
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        available_items = np.array(
+            RestaurantMenuItem.objects.filter(availability=True).values_list('product_id', 'restaurant_id'),
+            dtype='<i8',
+        ).reshape(-1, 2)
+        # Идентификаторы из самих пунктов меню тоже попадают в массивы, поэтому
+        # товар или ресторан, появившийся между чтениями, не сдвинет строки матрицы
+        product_ids = np.union1d(
+            np.fromiter(Product.objects.values_list('id', flat=True), dtype='<i8'),
+            available_items[:, 0],
+        ).astype('<i8')
+        restaurant_ids = np.union1d(
+            np.fromiter(Restaurant.objects.values_list('id', flat=True), dtype='<i8'),
+            available_items[:, 1],
+        ).astype('<i8')
+        catalog_json = build_catalog()
+
+    matrix = np.zeros((len(product_ids), len(restaurant_ids)), dtype=bool)
+    matrix[
+        np.searchsorted(product_ids, available_items[:, 0]),
+        np.searchsorted(restaurant_ids, available_items[:, 1]),
+    ] = True
+    availability = np.packbits(matrix, axis=1)
+    return b''.join([
+        HEADER.pack(
+            MAGIC, FORMAT_VERSION, version, len(product_ids), len(restaurant_ids), len(catalog_json)
+        ),
+        product_ids.tobytes(),
+        restaurant_ids.tobytes(),
+        availability.tobytes(),
+        catalog_json,
+    ])
+
+
+def write_snapshot(path, version):
+    content = build_snapshot(version)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Пишем во временный файл рядом и атомарно подменяем: читатели видят
+    # либо старый снимок целиком, либо новый
+    with tempfile.NamedTemporaryFile(dir=directory, prefix='.catalog-', delete=False) as snapshot_file:
+        snapshot_file.write(content)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(snapshot_file.name, path)
+    logger.info(f"Снимок каталога версии {version} записан в {path}")
+
+
+def open_snapshot(path):
+    try:
+        with open(path, 'rb') as snapshot_file:
+            buffer = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    try:
+        return CatalogSnapshot(buffer)
+    except (ValueError, struct.error):
+        logger.warning(f"Снимок каталога {path} повреждён, будет пересобран")
+        return None
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = f'{path}.lock'
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock_file = open(self.path, 'w')
+        if fcntl:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot():
+    """Актуальный снимок каталога; при смене версии пересобирается одним процессом на сервере."""
+    global _snapshot
+    version = get_version(CATALOG_VERSION)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    if not is_cache_shared():
+        # У каждого процесса своя версия каталога: общий файл процессы
+        # переписывали бы друг за другом, поэтому снимок держим в памяти процесса
+        with _snapshot_lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = CatalogSnapshot(build_snapshot(version))
+            return _snapshot
+
+    path = settings.CATALOG_SNAPSHOT_PATH
+    with _snapshot_lock:
+        snapshot = open_snapshot(path)
+        if snapshot is None or snapshot.version != version:
+            with _FileLock(path):
+                # Пока ждали блокировку, снимок мог собрать другой воркер
+                snapshot = open_snapshot(path)
+                if snapshot is None or snapshot.version != version:
+                    write_snapshot(path, version)
+                    snapshot = open_snapshot(path)
+        _snapshot = snapshot
+    return snapshot
@@ -0,0 +1,250 @@
+import logging
+import math
+import threading
+from collections import defaultdict
+
+from places.cache import get_coordinate_cache
+from places.geocoding import enqueue_addresses
+from .caching import bump_version, get_version
+from .distances import distance_matrix
+from .models import Restaurant
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = 111.195
+INDEX_VERSION = 'restaurant_index'
+
+
+class RestaurantIndex:
+    """Сетка из квадратных в градусах ячеек с координатами ресторанов.
+
+    Поиск обходит кольца ячеек вокруг точки и останавливается, как только
+    более далёкие кольца заведомо не могут дать ресторан ближе найденных.
+    """
+
+    def __init__(self, cell_km=5):
+        self.cell_degrees = cell_km / KM_PER_DEGREE
+        self.cells = defaultdict(dict)
+        self.coordinates = {}
+        self.bounds = None
+        self.version = None
+        self._lock = threading.RLock()
+
+    def _cell(self, lat, lon):
+        return (
+            math.floor(lat / self.cell_degrees),
+            math.floor(lon / self.cell_degrees),
+        )
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def upsert(self, restaurant_id, lat, lon):
+        with self._lock:
+            self._upsert(restaurant_id, lat, lon)
+
+    def remove(self, restaurant_id):
+        with self._lock:
+            self._remove(restaurant_id)
+
+    def nearest(self, lat, lon, k=None, radius_km=None, restaurant_ids=None):
+        """Ближайшие рестораны [(restaurant_id, км)] по возрастанию расстояния.
+
+        restaurant_ids ограничивает поиск этими ресторанами.
+        """
+        if restaurant_ids is not None:
+            restaurant_ids = set(restaurant_ids)
+        with self._lock:
+            return self._nearest(lat, lon, k, radius_km, restaurant_ids)
+
+    def _upsert(self, restaurant_id, lat, lon):
+        self._remove(restaurant_id)
+        lat, lon = float(lat), float(lon)
+        self.coordinates[restaurant_id] = (lat, lon)
+        row, column = self._cell(lat, lon)
+        self.cells[row, column][restaurant_id] = (lat, lon)
+        # Границы только расширяются: после удаления они остаются верхней оценкой
+        if self.bounds is None:
+            self.bounds = [row, row, column, column]
+        else:
+            self.bounds = [
+                min(self.bounds[0], row), max(self.bounds[1], row),
+                min(self.bounds[2], column), max(self.bounds[3], column),
+            ]
+
+    def _remove(self, restaurant_id):
+        coordinates = self.coordinates.pop(restaurant_id, None)
+        if coordinates is None:
+            return
+        cell = self._cell(*coordinates)
+        self.cells[cell].pop(restaurant_id, None)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def _ring(self, center, radius):
+        row, column = center
+        if radius == 0:
+            yield center
+            return
+        for d in range(-radius, radius + 1):
+            yield row - radius, column + d
+            yield row + radius, column + d
+        for d in range(-radius + 1, radius):
+            yield row + d, column - radius
+            yield row + d, column + radius
+
+    def _min_ring_distance(self, lat, radius):
+        # Нижняя оценка расстояния до ячеек кольца: по долготе ячейки
+        # сужаются к полюсам, поэтому берём косинус самой дальней от экватора широты
+        if radius == 0:
+            return 0
+        edge_latitude = min(abs(lat) + (radius + 1) * self.cell_degrees, 90)
+        return (radius - 1) * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(edge_latitude))
+
+    def _nearest(self, lat, lon, k, radius_km, restaurant_ids):
+        if not self.coordinates:
+            return []
+        lat, lon = float(lat), float(lon)
+        if k is None and radius_km is None:
+            return self._scan(lat, lon, restaurant_ids=restaurant_ids)
+        center = self._cell(lat, lon)
+        min_row, max_row, min_column, max_column = self.bounds
+        max_radius = max(
+            center[0] - min_row, max_row - center[0],
+            center[1] - min_column, max_column - center[1],
+        )
+
+        found = []
+        for radius in range(max_radius + 1):
+            lower_bound = self._min_ring_distance(lat, radius)
+            if radius_km is not None and lower_bound > radius_km:
+                break
+            if k is not None and len(found) >= k and found[k - 1][1] <= lower_bound:
+                break
+            if (2 * radius + 1) ** 2 > 4 * len(self.cells):
+                # Пустых ячеек вокруг слишком много, дешевле посчитать всё разом
+                return self._scan(lat, lon, k, radius_km, restaurant_ids)
+
+            candidates = [
+                (restaurant_id, coordinates)
+                for cell in self._ring(center, radius)
+                for restaurant_id, coordinates in self.cells.get(cell, {}).items()
+                if restaurant_ids is None or restaurant_id in restaurant_ids
+            ]
+            if not candidates:
+                continue
+            distances = distance_matrix(
+                [(lat, lon)], [coordinates for _, coordinates in candidates]
+            )[0]
+            found.extend(
+                (restaurant_id, float(distance_km))
+                for (restaurant_id, _), distance_km in zip(candidates, distances)
+                if radius_km is None or distance_km <= radius_km
+            )
+            found.sort(key=lambda item: item[1])
+
+        return found[:k] if k is not None else found
+
+    def _scan(self, lat, lon, k=None, radius_km=None, restaurant_ids=None):
+        restaurant_ids = [
+            restaurant_id for restaurant_id in self.coordinates
+            if restaurant_ids is None or restaurant_id in restaurant_ids
+        ]
+        distances = distance_matrix(
+            [(lat, lon)], [self.coordinates[restaurant_id] for restaurant_id in restaurant_ids]
+        )[0]
+        found = sorted(
+            (
+                (restaurant_id, float(distance_km))
+                for restaurant_id, distance_km in zip(restaurant_ids, distances)
+                if radius_km is None or distance_km <= radius_km
+            ),
+            key=lambda item: item[1],
+        )
+        return found[:k] if k is not None else found
+
+
+def load_restaurant_coordinates(restaurants):
+    return {
+        restaurant.id: restaurant.coordinates
+        for restaurant in restaurants
+        if restaurant.coordinates
+    }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_restaurant_index():
+    """Индекс ресторанов процесса; перестраивается, если его изменил другой процесс."""
+    global _index
+    version = get_version(INDEX_VERSION)
+    with _index_lock:
+        if _index is None or _index.version != version:
+            index = RestaurantIndex()
+            # Координаты хранятся в самих ресторанах: один запрос на перестройку
+            coordinates = load_restaurant_coordinates(
+                Restaurant.objects.filter(latitude__isnull=False).only('id', 'latitude', 'longitude')
+            )
+            for restaurant_id, (lat, lon) in coordinates.items():
+                index.upsert(restaurant_id, lat, lon)
+            index.version = version
+            _index = index
+            logger.info(f"Индекс ресторанов перестроен: {len(index)} ресторанов")
+        return _index
+
+
+def refresh_restaurant(restaurant, deleted=False):
+    """Точечно обновляет ресторан в индексе процесса и оповещает остальные процессы."""
+    coordinates = None if deleted else load_restaurant_coordinates([restaurant]).get(restaurant.id)
+    version = bump_version(INDEX_VERSION)
+    with _index_lock:
+        if _index is None:
+            return
+        if _index.version != version - 1:
+            # Пропустили чужие изменения: перестроим индекс при следующем обращении
+            _index.version = None
+            return
+        if coordinates:
+            _index.upsert(restaurant.id, *coordinates)
+        else:
+            _index.remove(restaurant.id)
+        _index.version = version
+
+
+def sync_restaurant_coordinates(places):
+    """Переносит свежие координаты мест в рестораны с этими адресами, возвращает переехавшие рестораны."""
+    coordinates = {place.canonical_key: place.coordinates for place in places if place.coordinates}
+    if not coordinates:
+        return []
+    # Адрес ресторана мог быть записан иначе, сравниваем канонические ключи
+    restaurants = []
+    for restaurant in Restaurant.objects.filter(canonical_key__in=coordinates).only(
+        'id', 'canonical_key', 'latitude', 'longitude',
+    ):
+        place_coordinates = coordinates[restaurant.canonical_key]
+        if place_coordinates != restaurant.coordinates:
+            restaurant.latitude, restaurant.longitude = place_coordinates
+            restaurants.append(restaurant)
+    Restaurant.objects.bulk_update(restaurants, ['latitude', 'longitude'])
+    for restaurant in restaurants:
+        refresh_restaurant(restaurant)
+    return restaurants
+
+
+def update_coordinates_on_address_change(instance, old_address):
+    """Подставляет в ресторан координаты нового адреса; сохраняет ресторан вызывающий код."""
+    if instance.address == old_address and instance.coordinates:
+        return False
+    coordinates = get_coordinate_cache().get(instance.address) if instance.address else None
+    if coordinates:
+        instance.latitude, instance.longitude = coordinates
+        logger.info(f"Координаты для адреса {instance.address} обновлены")
+    else:
+        instance.latitude = instance.longitude = None
+        if instance.address:
+            # Координаты подставит сигнал Place, когда воркер геокодирует адрес
+            enqueue_addresses([instance.address])
+            logger.warning(f"Адрес {instance.address} поставлен в очередь на геокодирование")
+    return True
@@ -0,0 +1,593 @@
+import datetime
+import itertools
+import json
+import random
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+
+from places.cache import get_coordinate_cache
+from places.geocoding import apply_location
+from places.models import Place
+from .availability import AVAILABILITY_VERSION, get_availability_index
+from .caching import get_version
+from .candidates import rebuild_order_candidates
+from .catalog import CATALOG_VERSION
+from .dispatch import DISPATCH_MODES, assign_exact, assign_greedy, dispatch_orders
+from .idempotency import IdempotencyKeyInProgress, claim_key
+from .intake import drain_intake, enqueue_order
+from .models import (
+    IdempotencyKey, Order, OrderCandidate, OrderIntake, OrderItem, Product, Restaurant, RestaurantMenuItem,
+)
+from .serializers import create_orders
+from .spatial import RestaurantIndex, sync_restaurant_coordinates
+from .views import accept_order
+
+
+class AvailabilityIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        cls.restaurant = Restaurant.objects.create(name='Ресторан', address='')
+
+    def test_version_changes_after_commit(self):
+        version = get_version(AVAILABILITY_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.product)
+            self.assertEqual(get_version(AVAILABILITY_VERSION), version)
+        self.assertNotEqual(get_version(AVAILABILITY_VERSION), version)
+        self.assertEqual(get_availability_index().get_restaurants([self.product.id]), [self.restaurant])
+
+    def test_restaurant_rename_rebuilds_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=self.product)
+        get_availability_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.name = 'Новое название'
+            self.restaurant.save()
+        restaurants = get_availability_index().get_restaurants([self.product.id])
+        self.assertEqual([restaurant.name for restaurant in restaurants], ['Новое название'])
+
+
+class CatalogVersionTest(TestCase):
+    def test_version_changes_after_commit(self):
+        version = get_version(CATALOG_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+            self.assertEqual(get_version(CATALOG_VERSION), version)
+        self.assertNotEqual(get_version(CATALOG_VERSION), version)
+
+
+class OrderCandidatesRepairTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        Place.objects.create(
+            address='Тверь, ул. Советская, 1', latitude=56.86, longitude=35.90, status=Place.RESOLVED,
+        )
+        cls.customer_place = Place.objects.create(
+            address='Тверь, ул. Советская, 10', latitude=56.87, longitude=35.90, status=Place.RESOLVED,
+        )
+        cls.restaurant = Restaurant.objects.create(name='Ресторан', address='Тверь, ул. Советская, 1')
+        cls.menu_item = RestaurantMenuItem.objects.create(restaurant=cls.restaurant, product=cls.product)
+
+    def setUp(self):
+        # Кэш координат общий для процесса, забываем всё, что могли запомнить другие тесты
+        get_coordinate_cache().forget(Place.objects.values_list('canonical_key', flat=True))
+        self.order = self.create_order('г. Тверь, Советская ул., д. 10')
+
+    def create_order(self, address):
+        order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79261234567', address=address,
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price=self.product.price)
+        rebuild_order_candidates([order.id])
+        return order
+
+    def get_distances(self, order):
+        return dict(order.candidates.values_list('restaurant_id', 'distance_km'))
+
+    def test_menu_item_flip(self):
+        self.assertEqual(list(self.get_distances(self.order)), [self.restaurant.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item.availability = False
+            self.menu_item.save()
+        self.assertEqual(self.get_distances(self.order), {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item.availability = True
+            self.menu_item.save()
+        self.assertEqual(list(self.get_distances(self.order)), [self.restaurant.id])
+
+    def test_restaurant_move(self):
+        distance_km = self.get_distances(self.order)[self.restaurant.id]
+        Place.objects.create(
+            address='Тверь, ул. Советская, 50', latitude=56.95, longitude=35.90, status=Place.RESOLVED,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant.address = 'Тверь, ул. Советская, 50'
+            self.restaurant.save()
+        self.assertGreater(self.get_distances(self.order)[self.restaurant.id], distance_km)
+
+    def test_address_geocoded(self):
+        order = self.create_order('Тверь, Советская 20')
+        self.assertEqual(self.get_distances(order), {})
+
+        # Место записано иначе, чем адрес в заказе
+        with self.captureOnCommitCallbacks(execute=True):
+            Place.objects.create(
+                address='г. Тверь, ул. Советская, д. 20', latitude=56.88, longitude=35.90,
+                status=Place.RESOLVED,
+            )
+        self.assertEqual(list(self.get_distances(order)), [self.restaurant.id])
+
+    def test_address_geocoded_again(self):
+        distance_km = self.get_distances(self.order)[self.restaurant.id]
+
+        # У заказа уже есть кандидаты, но после уточнения координат расстояние другое
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer_place.latitude = 56.90
+            self.customer_place.save()
+        self.assertGreater(self.get_distances(self.order)[self.restaurant.id], distance_km)
+
+    def test_restaurant_address_geocoded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = Restaurant.objects.create(name='Новый ресторан', address='Тверь, Советская 30')
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.product)
+        self.assertIsNone(restaurant.coordinates)
+
+        # Адрес встал в очередь, воркер геокодирует его
+        place = Place.objects.get(status=Place.PENDING)
+        with self.captureOnCommitCallbacks(execute=True):
+            place.latitude, place.longitude, place.status = 56.88, 35.90, Place.RESOLVED
+            place.save()
+        restaurant.refresh_from_db()
+        self.assertIsNotNone(restaurant.coordinates)
+        self.assertIn(restaurant.id, self.get_distances(self.order))
+
+    def test_same_coordinates_do_not_move_restaurant(self):
+        place = Place.objects.get(address='Тверь, ул. Советская, 1')
+        # Геокодер отвечает строками, как в ответе API
+        apply_location(place, ('35.9', '56.86'))
+        self.assertEqual(sync_restaurant_coordinates([place]), [])
+
+        apply_location(place, ('35.9', '56.87'))
+        self.assertEqual(sync_restaurant_coordinates([place]), [self.restaurant])
+
+    def test_order_without_items_fits_any_restaurant(self):
+        self.order.items.all().delete()
+        rebuild_order_candidates([self.order.id])
+        self.assertEqual(list(self.get_distances(self.order)), [self.restaurant.id])
+
+        Place.objects.create(
+            address='Тверь, ул. Советская, 40', latitude=56.89, longitude=35.90, status=Place.RESOLVED,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant = Restaurant.objects.create(name='Новый ресторан', address='Тверь, ул. Советская, 40')
+        self.assertEqual(sorted(self.get_distances(self.order)), [self.restaurant.id, restaurant.id])
+
+
+class DrainIntakeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def enqueue(self, address, product_id=None):
+        return enqueue_order({
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79261234567',
+            'address': address,
+            'products': [{'product': product_id or self.product.id, 'quantity': 2}],
+        })
+
+    def test_drain_creates_orders(self):
+        intakes = [self.enqueue(f'Тверь, ул. Советская, {number}') for number in range(3)]
+        self.assertEqual(drain_intake(), 3)
+
+        for intake in intakes:
+            intake.refresh_from_db()
+            self.assertEqual(intake.status, OrderIntake.CREATED)
+            self.assertEqual(intake.order.total_price, 200)
+            self.assertIsNotNone(intake.processed_at)
+        self.assertEqual(drain_intake(), 0)
+
+    def test_invalid_intake_is_rejected(self):
+        valid = self.enqueue('Тверь, ул. Советская, 1')
+        invalid = self.enqueue('Тверь, ул. Советская, 2', product_id=self.product.id + 100)
+        self.assertEqual(drain_intake(), 2)
+
+        valid.refresh_from_db()
+        invalid.refresh_from_db()
+        self.assertEqual(valid.status, OrderIntake.CREATED)
+        self.assertEqual(invalid.status, OrderIntake.REJECTED)
+        self.assertIn('products', invalid.errors)
+        self.assertIsNone(invalid.order)
+
+    def test_failed_intake_does_not_block_queue(self):
+        def create_or_fail(validated_orders):
+            validated_orders = list(validated_orders)
+            if any(data['address'] == 'сломанный адрес' for data in validated_orders):
+                raise IntegrityError('сломанная заявка')
+            return create_orders(validated_orders)
+
+        first = self.enqueue('Тверь, ул. Советская, 1')
+        poison = self.enqueue('сломанный адрес')
+        last = self.enqueue('Тверь, ул. Советская, 3')
+        with mock.patch('foodcartapp.intake.create_orders', side_effect=create_or_fail):
+            self.assertEqual(drain_intake(), 3)
+
+        for intake in [first, poison, last]:
+            intake.refresh_from_db()
+        self.assertEqual(first.status, OrderIntake.CREATED)
+        self.assertEqual(last.status, OrderIntake.CREATED)
+        self.assertEqual(poison.status, OrderIntake.FAILED)
+        self.assertIn('сломанная заявка', poison.errors['detail'])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+def brute_force_assignment(candidates, capacities):
+    """Лучшее распределение перебором: (число заказов, суммарное расстояние)."""
+    options = {}
+    for order_id, restaurant_id, distance_km in candidates:
+        options.setdefault(order_id, [(None, 0)]).append((restaurant_id, distance_km))
+    best = (0, 0)
+    for choice in itertools.product(*options.values()):
+        loads = {}
+        for restaurant_id, _ in choice:
+            if restaurant_id is not None:
+                loads[restaurant_id] = loads.get(restaurant_id, 0) + 1
+        if any(load > capacities.get(restaurant_id, 0) for restaurant_id, load in loads.items()):
+            continue
+        assigned = sum(loads.values())
+        total_km = sum(distance_km for _, distance_km in choice)
+        if assigned > best[0] or assigned == best[0] and total_km < best[1]:
+            best = (assigned, total_km)
+    return best
+
+
+def describe_assignment(assignments, candidates, capacities):
+    distances = {(order_id, restaurant_id): km for order_id, restaurant_id, km in candidates}
+    loads = {}
+    for order_id, restaurant_id in assignments.items():
+        loads[restaurant_id] = loads.get(restaurant_id, 0) + 1
+    assert all(load <= capacities[restaurant_id] for restaurant_id, load in loads.items())
+    return len(assignments), sum(distances[pair] for pair in assignments.items())
+
+
+class AssignmentTest(TestCase):
+    def test_greedy_respects_capacity(self):
+        candidates = [(1, 10, 1.0), (2, 10, 2.0), (3, 10, 3.0), (3, 20, 5.0)]
+        assignments = assign_greedy(candidates, {10: 2, 20: 1})
+        self.assertEqual(assignments, {1: 10, 2: 10, 3: 20})
+
+        # Без свободных мест заказ остаётся без ресторана
+        self.assertEqual(assign_greedy(candidates, {10: 1}), {1: 10})
+        self.assertEqual(assign_greedy(candidates, {10: 0, 20: 0}), {})
+
+    def test_exact_beats_greedy(self):
+        # Жадный отдаёт ближайший ресторан первому заказу, и второй остаётся без ресторана
+        candidates = [(1, 10, 1.0), (1, 20, 2.0), (2, 10, 1.5)]
+        capacities = {10: 1, 20: 1}
+        self.assertEqual(assign_greedy(candidates, capacities), {1: 10})
+        self.assertEqual(assign_exact(candidates, capacities), {1: 20, 2: 10})
+
+    def test_exact_is_optimal(self):
+        generator = random.Random(0)
+        for _ in range(200):
+            restaurant_ids = range(generator.randint(1, 4))
+            capacities = {restaurant_id: generator.randint(0, 3) for restaurant_id in restaurant_ids}
+            candidates = [
+                (order_id, restaurant_id, round(generator.uniform(0.1, 10), 3))
+                for order_id in range(generator.randint(1, 6))
+                for restaurant_id in restaurant_ids
+                if generator.random() < 0.6
+            ]
+            assigned, total_km = describe_assignment(
+                assign_exact(candidates, capacities), candidates, capacities,
+            )
+            best_assigned, best_total_km = brute_force_assignment(candidates, capacities)
+            self.assertEqual(assigned, best_assigned)
+            self.assertAlmostEqual(total_km, best_total_km, places=6)
+
+
+class DispatchOrdersTestMixin:
+    def create_restaurant(self, name, address, latitude, capacity):
+        Place.objects.create(address=address, latitude=latitude, longitude=28.33, status=Place.RESOLVED)
+        restaurant = Restaurant.objects.create(name=name, address=address, capacity=capacity)
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.product)
+        return restaurant
+
+    def create_order(self, address, latitude):
+        Place.objects.create(address=address, latitude=latitude, longitude=28.33, status=Place.RESOLVED)
+        order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79261234567', address=address,
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price=self.product.price)
+        rebuild_order_candidates([order.id])
+        return order
+
+    def set_up_restaurants(self):
+        get_coordinate_cache().forget(Place.objects.values_list('canonical_key', flat=True))
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.near = self.create_restaurant('Ближний', 'Псков, ул. Ленина, 1', 57.81, capacity=1)
+        self.far = self.create_restaurant('Дальний', 'Псков, ул. Ленина, 90', 57.90, capacity=5)
+
+
+class DispatchOrdersTest(DispatchOrdersTestMixin, TestCase):
+    def setUp(self):
+        self.set_up_restaurants()
+
+    def test_dispatch_fills_capacity_and_starts_cooking(self):
+        first = self.create_order('Псков, ул. Ленина, 2', 57.811)
+        second = self.create_order('Псков, ул. Ленина, 3', 57.812)
+        self.assertEqual(dispatch_orders(), 2)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        # У ближнего ресторана одно место, второй заказ уходит в дальний
+        self.assertEqual(first.restaurant, self.near)
+        self.assertEqual(second.restaurant, self.far)
+        self.assertEqual({first.status, second.status}, {Order.PROCESSING})
+        # У назначенного заказа остаётся единственный кандидат — его ресторан
+        self.assertEqual(
+            list(OrderCandidate.objects.filter(order=second).values_list('restaurant_id', flat=True)),
+            [self.far.id],
+        )
+
+    def test_busy_kitchen_counts_against_capacity(self):
+        busy = self.create_order('Псков, ул. Ленина, 2', 57.811)
+        Order.objects.filter(pk=busy.pk).update(restaurant=self.near, status=Order.PROCESSING)
+        order = self.create_order('Псков, ул. Ленина, 3', 57.812)
+        self.assertEqual(dispatch_orders(mode='exact'), 1)
+
+        order.refresh_from_db()
+        self.assertEqual(order.restaurant, self.far)
+
+    def test_manual_assignment_during_solve_wins(self):
+        first = self.create_order('Псков, ул. Ленина, 2', 57.811)
+        second = self.create_order('Псков, ул. Ленина, 3', 57.812)
+
+        def assign_while_manager_edits(candidates, capacities):
+            # Пока считается распределение, менеджер назначил первому заказу ближний ресторан
+            Order.objects.filter(pk=first.pk).update(restaurant=self.near, status=Order.PROCESSING)
+            return assign_greedy(candidates, capacities)
+
+        with mock.patch.dict(DISPATCH_MODES, {'greedy': assign_while_manager_edits}):
+            self.assertEqual(dispatch_orders(), 1)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        # Ручное назначение не перезаписано, второй заказ ушёл в дальний ресторан
+        self.assertEqual(first.restaurant, self.near)
+        self.assertEqual(second.restaurant, self.far)
+
+    def test_full_restaurant_is_rechecked_on_apply(self):
+        order = self.create_order('Псков, ул. Ленина, 2', 57.811)
+        busy = self.create_order('Псков, ул. Ленина, 3', 57.812)
+
+        def assign_while_manager_edits(candidates, capacities):
+            # Пока считается распределение, менеджер занял последнее место ближнего ресторана
+            Order.objects.filter(pk=busy.pk).update(restaurant=self.near, status=Order.PROCESSING)
+            return {order.id: self.near.id}
+
+        with mock.patch.dict(DISPATCH_MODES, {'greedy': assign_while_manager_edits}):
+            self.assertEqual(dispatch_orders(), 0)
+        order.refresh_from_db()
+        self.assertIsNone(order.restaurant)
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class DispatchLockedOrdersTest(DispatchOrdersTestMixin, TransactionTestCase):
+    def setUp(self):
+        self.set_up_restaurants()
+
+    def test_locked_order_is_skipped(self):
+        locked = self.create_order('Псков, ул. Ленина, 2', 57.811)
+        free = self.create_order('Псков, ул. Ленина, 3', 57.812)
+        order_locked, release = threading.Event(), threading.Event()
+
+        def edit_order():
+            # Менеджер держит заказ открытым в админке
+            try:
+                with transaction.atomic():
+                    Order.objects.select_for_update().get(pk=locked.pk)
+                    order_locked.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        editor = threading.Thread(target=edit_order)
+        editor.start()
+        try:
+            self.assertTrue(order_locked.wait(10))
+            self.assertEqual(dispatch_orders(), 1)
+        finally:
+            release.set()
+            editor.join()
+
+        locked.refresh_from_db()
+        free.refresh_from_db()
+        self.assertIsNone(locked.restaurant)
+        self.assertIsNotNone(free.restaurant)
+
+
+class IdempotencyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def setUp(self):
+        self.data = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79261234567',
+            'address': 'Псков, ул. Ленина, 7',
+            'products': [{'product': self.product.id, 'quantity': 1}],
+        }
+
+    def post_order(self, data, key='ключ'):
+        return self.client.post(
+            '/api/order/', data, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_saved_response(self):
+        first = self.post_order(self.data)
+        second = self.post_order(self.data)
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_mismatched_payload_is_rejected(self):
+        self.post_order(self.data)
+        response = self.post_order({**self.data, 'address': 'Псков, ул. Ленина, 8'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_concurrent_claim_is_rejected(self):
+        claim_key('ключ', self.data)
+        response = self.post_order(self.data)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_taken_over_key_creates_one_order(self):
+        first = claim_key('ключ', self.data)
+        # Первый запрос завис дольше таймаута, повтор забирает ключ себе
+        IdempotencyKey.objects.filter(pk=first.pk).update(
+            created_at=timezone.now() - datetime.timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT + 1),
+        )
+        second = claim_key('ключ', self.data)
+        self.assertNotEqual(second.owner_token, first.owner_token)
+
+        # Первый запрос всё же дошёл до записи: его заказ откатывается
+        with self.assertRaises(IdempotencyKeyInProgress):
+            accept_order(self.data, idempotency_record=first)
+        self.assertEqual(Order.objects.count(), 0)
+
+        accept_order(self.data, idempotency_record=second)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.post_order(self.data)['Idempotent-Replayed'], 'true')
+
+
+class OrdersBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.partner = User.objects.create_user('partner', password='partner')
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        Place.objects.create(
+            address='Псков, Октябрьский пр., 1', latitude=57.81, longitude=28.33, status=Place.RESOLVED,
+        )
+        cls.restaurant = Restaurant.objects.create(name='Ресторан', address='Псков, Октябрьский пр., 1')
+        RestaurantMenuItem.objects.create(restaurant=cls.restaurant, product=cls.product)
+        Place.objects.create(
+            address='Псков, Октябрьский пр., 20', latitude=57.82, longitude=28.33, status=Place.RESOLVED,
+        )
+
+    def setUp(self):
+        get_coordinate_cache().forget(Place.objects.values_list('canonical_key', flat=True))
+        self.client.force_login(self.partner)
+
+    def make_order(self, address='Псков, Октябрьский пр., 20', quantity=2):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79261234567',
+            'address': address,
+            'products': [{'product': self.product.id, 'quantity': quantity}],
+        }
+
+    def post_batch(self, orders_data):
+        return self.client.post('/api/orders/batch/', orders_data, content_type='application/json')
+
+    def test_batch_must_be_list(self):
+        response = self.post_batch(self.make_order())
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ORDERS_BATCH_MAX_SIZE=2)
+    def test_batch_size_is_limited(self):
+        response = self.post_batch([self.make_order()] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_batch_requires_login(self):
+        self.client.logout()
+        response = self.post_batch([self.make_order()])
+        self.assertEqual(response.status_code, 403)
+
+    def test_partial_errors(self):
+        orders_data = [self.make_order(), self.make_order(quantity=0), self.make_order()]
+        response = self.post_batch(orders_data)
+
+        self.assertEqual(response.status_code, 201)
+        created = response.json()['created']
+        self.assertEqual([order['index'] for order in created], [0, 2])
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1])
+        self.assertIn('products', response.json()['errors'][0]['errors'])
+        orders = Order.objects.filter(id__in=[order['id'] for order in created])
+        self.assertEqual([order.total_price for order in orders], [200, 200])
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+    def test_all_invalid(self):
+        response = self.post_batch([self.make_order(quantity=0)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], [])
+        self.assertFalse(Order.objects.exists())
+
+    def test_ndjson_batch(self):
+        body = '\n'.join(json.dumps(order_data) for order_data in [self.make_order(), self.make_order()])
+        response = self.client.post('/api/orders/batch/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_candidates_and_addresses_are_written(self):
+        orders_data = [self.make_order(), self.make_order('Псков, ул. Ленина, 99')]
+        with mock.patch('foodcartapp.serializers.touch_addresses') as touch_addresses:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.post_batch(orders_data)
+        self.assertEqual(response.status_code, 201)
+
+        touch_addresses.assert_called_once()
+        self.assertEqual(
+            sorted(touch_addresses.call_args.args[0]),
+            ['Псков, Октябрьский пр., 20', 'Псков, ул. Ленина, 99'],
+        )
+        located, unknown = Order.objects.order_by('id')
+        self.assertEqual(located.canonical_key, 'псков октябрьский пр-т 20')
+        self.assertEqual(
+            list(located.candidates.values_list('restaurant_id', flat=True)), [self.restaurant.id],
+        )
+        # Адрес ещё не геокодирован, кандидатов нет до ответа геокодера
+        self.assertFalse(unknown.candidates.exists())
+
+
+class RestaurantIndexTest(TestCase):
+    def test_nearest_matches_full_scan(self):
+        generator = random.Random(0)
+        index = RestaurantIndex(cell_km=2)
+        for restaurant_id in range(300):
+            index.upsert(restaurant_id, generator.uniform(55.5, 56), generator.uniform(37.3, 37.9))
+        allowed = set(range(0, 300, 3))
+        for _ in range(20):
+            lat, lon = generator.uniform(55.5, 56), generator.uniform(37.3, 37.9)
+            for k, radius_km, restaurant_ids in [(5, None, None), (None, 3, None), (5, 10, allowed)]:
+                expected = index._scan(lat, lon, k, radius_km, restaurant_ids)
+                self.assertEqual(index.nearest(lat, lon, k, radius_km, restaurant_ids), expected)
+
+    def test_nearest_without_allowed_restaurants(self):
+        index = RestaurantIndex()
+        index.upsert(1, 55.75, 37.62)
+        self.assertEqual(index.nearest(55.75, 37.62, k=3, restaurant_ids=[]), [])
+        self.assertEqual(index.nearest(55.75, 37.62, restaurant_ids=[]), [])
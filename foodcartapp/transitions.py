@@ -0,0 +1,24 @@
+from django.utils import timezone
+
+from .models import Order
+
+
+def transition_orders(orders, from_statuses, to_status):
+    """Переводит заказы в статус одним условным UPDATE, возвращает число переведённых.
+
+    Условие на текущий статус проверяет сама база: заказ, который другой
+    процесс уже перевёл дальше, не откатится, а чтения заказов не нужны.
+    """
+    return orders.filter(status__in=from_statuses).update(
+        status=to_status,
+        updated_at=timezone.now(),
+    )
+
+
+def start_cooking(order_ids):
+    """Ресторан назначен — заказ готовится: new → prc."""
+    return transition_orders(
+        Order.objects.filter(id__in=list(order_ids), restaurant__isnull=False),
+        [Order.UNPROCESSING],
+        Order.PROCESSING,
+    )
@@ -1,6 +1,7 @@
 from django.urls import include, path
 
-from .views import (product_list_api, banners_list_api, register_order)
+from .views import (product_list_api, banners_list_api, register_order,
+                    register_orders_batch, order_intake_status)
 
 app_name = "foodcartapp"
 
@@ -8,5 +9,7 @@ urlpatterns = [
     path('products/', product_list_api),
     path('banners/', banners_list_api),
     path('order/', register_order),
+    path('order/intake/<uuid:tracking_id>/', order_intake_status, name='order_intake_status'),
+    path('orders/batch/', register_orders_batch),
     path('api-auth/', include('rest_framework.urls')),
 ]
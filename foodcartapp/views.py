@@ -1,16 +1,26 @@
 import logging
 
+from django.conf import settings
 from django.db import transaction
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.templatetags.static import static
+from django.urls import reverse
+from django.utils.http import parse_etags
 
 from rest_framework import serializers, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.serializers import ModelSerializer
 
-from .models import Order, OrderItem, Product
-from .serializers import OrderSerializer
+from .idempotency import IDEMPOTENCY_HEADER, claim_key, release_key, save_response
+from .intake import enqueue_order
+from .models import Order, OrderIntake, OrderItem
+from .parsers import NDJSONParser
+from .serializers import OrderSerializer, create_orders, validate_orders
+from .snapshot import get_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -46,37 +56,97 @@ def banners_list_api(request):
 
 
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    snapshot = get_snapshot()
+    etag = f'"catalog-{snapshot.version}"'
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(snapshot.catalog_json, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 
-@transaction.atomic
 @api_view(['POST'])
 def register_order(request):
-    serializer = OrderSerializer(data=request.data)
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not idempotency_key:
+        return accept_order(request.data)
+
+    record = claim_key(idempotency_key, request.data)
+    if record.response_status is not None:
+        # Повтор уже выполненного запроса: таблицы заказов не трогаем
+        response = Response(record.response_body, status=record.response_status)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    try:
+        return accept_order(request.data, idempotency_record=record)
+    except Exception:
+        release_key(record)
+        raise
+
+
+def accept_order(data, idempotency_record=None):
+    serializer = OrderSerializer(data=data)
+    # Валидация и загрузка товаров идут до транзакции, чтобы не держать её открытой
     serializer.is_valid(raise_exception=True)
-    serializer.save()
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    with transaction.atomic():
+        if settings.ORDER_INTAKE_MODE:
+            # Пиковый режим: только запись в очередь, заказ создаст drain_order_intake
+            intake = enqueue_order(data)
+            response_status, response_data = status.HTTP_202_ACCEPTED, get_intake_status(intake)
+        else:
+            serializer.save()
+            response_status, response_data = status.HTTP_201_CREATED, serializer.data
+        if idempotency_record:
+            save_response(idempotency_record, response_status, response_data)
+    return Response(response_data, status=response_status)
+
+
+def get_intake_status(intake):
+    return {
+        'tracking_id': str(intake.tracking_id),
+        'status': intake.status,
+        'status_url': reverse('foodcartapp:order_intake_status', args=[intake.tracking_id]),
+        'order_id': intake.order_id,
+        'errors': intake.errors,
+    }
+
+
+@api_view(['GET'])
+def order_intake_status(request, tracking_id):
+    intake = get_object_or_404(OrderIntake, tracking_id=tracking_id)
+    return Response(get_intake_status(intake))
+
+
+@api_view(['POST'])
+@parser_classes([JSONParser, NDJSONParser])
+@permission_classes([IsAuthenticated])
+def register_orders_batch(request):
+    """Пачка заказов от партнёров: JSON-массив или NDJSON, по заказу на строку."""
+    orders_data = request.data
+    if not isinstance(orders_data, list):
+        return Response(
+            {'detail': 'Ожидается список заказов.'}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(orders_data) > settings.ORDERS_BATCH_MAX_SIZE:
+        return Response(
+            {'detail': f'В пачке не может быть больше {settings.ORDERS_BATCH_MAX_SIZE} заказов.'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    validated_orders, errors = validate_orders(orders_data)
+    with transaction.atomic():
+        orders = create_orders(validated_data for _, validated_data in validated_orders)
+
+    # Ответ по каждому заказу в порядке пачки: номер и id созданного заказа либо ошибки
+    created = [
+        {'index': number, 'id': order.id}
+        for (number, _), order in zip(validated_orders, orders)
+    ]
+    failed = [{'index': number, 'errors': order_errors} for number, order_errors in errors.items()]
+    response_status = status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+    return Response({'created': created, 'errors': failed}, status=response_status)
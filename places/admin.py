@@ -4,6 +4,9 @@ from .models import Place
 
 @admin.register(Place)
 class PlaceAdmin(admin.ModelAdmin):
+    list_display = ['address', 'status', 'attempts', 'next_attempt_at']
+    list_filter = ['status']
+    search_fields = ['address']
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'places'
     from django.contrib import admin
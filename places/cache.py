@@ -0,0 +1,144 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Place
+from .normalization import normalize_address
+
+
+class CoordinateCache:
+    """Координаты адресов: LRU процесса, затем общий кэш Django, затем таблица Place.
+
+    В общий кэш попадают только найденные координаты. Ненайденные адреса
+    LRU помнит недолго (negative_ttl), чтобы страница заказов не спрашивала
+    о них базу на каждом запросе, но увидела координаты вскоре после геокодирования.
+    """
+
+    def __init__(self, max_size=10000, ttl=300, negative_ttl=30, shared_ttl=24 * 60 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared_ttl = shared_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            'local_hits': 0,
+            'shared_hits': 0,
+            'db_hits': 0,
+            'misses': 0,
+        }
+
+    def _shared_key(self, canonical_key):
+        # Ключи memcached не могут содержать пробелы и длиннее 250 байт
+        return 'coordinates:' + hashlib.sha1(canonical_key.encode('utf-8')).hexdigest()
+
+    def _remember(self, canonical_key, coordinates):
+        ttl = self.ttl if coordinates else self.negative_ttl
+        self._entries[canonical_key] = (coordinates, time.monotonic() + ttl)
+        self._entries.move_to_end(canonical_key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_many(self, addresses):
+        """Координаты адресов {адрес: (широта, долгота)}; адресов без координат в ответе нет."""
+        keys = {address: normalize_address(address) for address in set(addresses) if address}
+        found = {}
+        missing = set()
+        now = time.monotonic()
+        with self._lock:
+            for canonical_key in set(keys.values()):
+                entry = self._entries.get(canonical_key)
+                if entry is None or entry[1] < now:
+                    missing.add(canonical_key)
+                    continue
+                self._entries.move_to_end(canonical_key)
+                self.stats['local_hits'] += 1
+                if entry[0]:
+                    found[canonical_key] = entry[0]
+
+        if missing:
+            shared_keys = {self._shared_key(canonical_key): canonical_key for canonical_key in missing}
+            shared_found = {
+                shared_keys[shared_key]: tuple(coordinates)
+                for shared_key, coordinates in cache.get_many(list(shared_keys)).items()
+            }
+            missing -= set(shared_found)
+
+            db_found = {}
+            if missing:
+                places = Place.objects.filter(
+                    canonical_key__in=missing, status=Place.RESOLVED,
+                ).values_list('canonical_key', 'latitude', 'longitude')
+                db_found = {canonical_key: (lat, lon) for canonical_key, lat, lon in places}
+                cache.set_many(
+                    {self._shared_key(key): coordinates for key, coordinates in db_found.items()},
+                    timeout=self.shared_ttl,
+                )
+
+            with self._lock:
+                self.stats['shared_hits'] += len(shared_found)
+                self.stats['db_hits'] += len(db_found)
+                self.stats['misses'] += len(missing - set(db_found))
+                for canonical_key in missing | set(shared_found):
+                    self._remember(canonical_key, shared_found.get(canonical_key) or db_found.get(canonical_key))
+            found.update(shared_found)
+            found.update(db_found)
+
+        return {
+            address: found[canonical_key]
+            for address, canonical_key in keys.items()
+            if canonical_key in found
+        }
+
+    def get(self, address):
+        return self.get_many([address]).get(address)
+
+    def update(self, places):
+        """Запись через кэш: координаты мест сразу попадают в оба уровня, места без координат забываются."""
+        resolved = {place.canonical_key: place.coordinates for place in places if place.coordinates}
+        if resolved:
+            cache.set_many(
+                {self._shared_key(key): coordinates for key, coordinates in resolved.items()},
+                timeout=self.shared_ttl,
+            )
+            with self._lock:
+                for canonical_key, coordinates in resolved.items():
+                    self._remember(canonical_key, coordinates)
+        self.forget(place.canonical_key for place in places if not place.coordinates)
+
+    def forget(self, canonical_keys):
+        canonical_keys = set(canonical_keys)
+        if not canonical_keys:
+            return
+        cache.delete_many([self._shared_key(key) for key in canonical_keys])
+        with self._lock:
+            for canonical_key in canonical_keys:
+                self._entries.pop(canonical_key, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+_coordinate_cache = None
+_coordinate_cache_lock = threading.Lock()
+
+
+def get_coordinate_cache():
+    global _coordinate_cache
+    with _coordinate_cache_lock:
+        if _coordinate_cache is None:
+            _coordinate_cache = CoordinateCache(
+                max_size=settings.COORDINATE_CACHE_SIZE,
+                ttl=settings.COORDINATE_CACHE_TTL,
+                shared_ttl=settings.COORDINATE_CACHE_SHARED_TTL,
+            )
+        return _coordinate_cache
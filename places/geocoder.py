@@ -0,0 +1,244 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests import RequestException
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class GeocoderUnavailable(RequestException):
+    """Геокодер признан деградировавшим, запрос не отправлялся."""
+
+
+class GeocoderRateLimited(GeocoderUnavailable):
+    """Лимит запросов в секунду исчерпан до истечения срока ожидания."""
+
+
+class RequestBudget:
+    """Общий для всех процессов лимит запросов в секунду.
+
+    Счётчик запросов текущей секунды живёт в кэше Django, поэтому лимит
+    общий ровно настолько, насколько общий кэш (см. CACHE_URL).
+    """
+
+    def __init__(self, rate, name='geocoder'):
+        self.rate = rate
+        self.name = name
+
+    def acquire(self, deadline):
+        """Ждёт свободного места в лимите, deadline — момент по time.monotonic()."""
+        if not self.rate:
+            return
+        while True:
+            now = time.time()
+            window = int(now)
+            key = f'budget:{self.name}:{window}'
+            cache.add(key, 0, timeout=5)
+            try:
+                used = cache.incr(key)
+            except ValueError:
+                # Счётчик вытеснили из кэша между add и incr, пробуем снова
+                continue
+            if used <= self.rate:
+                return
+            wait = window + 1 - now + random.uniform(0, 0.05)
+            if time.monotonic() + wait > deadline:
+                raise GeocoderRateLimited(f'Исчерпан лимит {self.rate} запросов в секунду')
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_thread = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                # Пропускаем пробный запрос, остальные ждут его результата
+                self.state = self.HALF_OPEN
+                self.probe_thread = threading.get_ident()
+                return True
+            if self.state == self.HALF_OPEN:
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def release(self):
+        """Возвращает пробу, если запрос так и не дошёл до геокодера.
+
+        Предохранитель снова открыт с прежним opened_at, поэтому следующий
+        запрос сразу станет новой пробой, а не будет ждать recovery_timeout.
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self.probe_thread == threading.get_ident():
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Геокодер недоступен, запросы приостановлены на {self.recovery_timeout} с")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class YandexGeocoder:
+    base_url = 'https://geocode-maps.yandex.ru/1.x'
+    retry_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, apikey, timeout=5, deadline=10, retries=2, backoff=0.5,
+                 pool_size=10, failure_threshold=5, recovery_timeout=30, rate_limit=None):
+        self.apikey = apikey
+        self.budget = RequestBudget(rate_limit)
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+
+        # Пул keep-alive соединений: TCP+TLS рукопожатие только на первый запрос
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'found': 0,
+            'not_found': 0,
+            'failures': 0,
+            'retries': 0,
+            'rejected': 0,
+            'throttled': 0,
+            'latency_total': 0.0,
+            'latency_max': 0.0,
+        }
+
+    def fetch_coordinates(self, address):
+        if not self.breaker.allow_request():
+            self._count('rejected')
+            raise GeocoderUnavailable(f'Геокодер недоступен, адрес {address} не отправлен')
+
+        started_at = time.monotonic()
+        try:
+            response = self._request(address, started_at)
+        except GeocoderRateLimited:
+            # Запрос не отправлялся, геокодер тут ни при чём
+            self._count('throttled')
+            self.breaker.release()
+            raise
+        except RequestException:
+            self._count('failures')
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Ошибка не геокодера: если это была проба, её надо вернуть,
+            # иначе предохранитель навсегда останется полуоткрытым
+            self.breaker.release()
+            raise
+        finally:
+            self._observe_latency(time.monotonic() - started_at)
+        self.breaker.record_success()
+
+        found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+        if not found_places:
+            self._count('not_found')
+            return None
+
+        self._count('found')
+        most_relevant = found_places[0]
+        lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+        return lon, lat
+
+    def _request(self, address, started_at):
+        params = {
+            'geocode': address,
+            'apikey': self.apikey,
+            'format': 'json',
+        }
+        for attempt in range(self.retries + 1):
+            remaining = self.deadline - (time.monotonic() - started_at)
+            if remaining <= 0:
+                raise requests.Timeout(f'Истёк срок ожидания геокодера для адреса {address}')
+
+            self.budget.acquire(started_at + self.deadline)
+            self._count('requests')
+            try:
+                response = self.session.get(
+                    self.base_url, params=params, timeout=min(self.timeout, remaining)
+                )
+                response.raise_for_status()
+                return response
+            except requests.HTTPError as error:
+                if error.response.status_code not in self.retry_statuses or attempt == self.retries:
+                    raise
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+
+            # Экспоненциальная пауза с полным джиттером, но не дольше дедлайна
+            self._count('retries')
+            pause = random.uniform(0, self.backoff * 2 ** attempt)
+            time.sleep(min(pause, max(self.deadline - (time.monotonic() - started_at), 0)))
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _observe_latency(self, latency):
+        with self._stats_lock:
+            self.stats['latency_total'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats['found'] + stats['not_found'] + stats['failures']
+        stats['latency_avg'] = stats['latency_total'] / lookups if lookups else 0.0
+        stats['failure_rate'] = stats['failures'] / lookups if lookups else 0.0
+        stats['circuit'] = self.breaker.state
+        return stats
+
+
+_geocoders = {}
+_geocoders_lock = threading.Lock()
+
+
+def get_geocoder(apikey=None):
+    apikey = apikey or settings.YANDEX_GEOCODER_API_KEY
+    with _geocoders_lock:
+        if apikey not in _geocoders:
+            _geocoders[apikey] = YandexGeocoder(
+                apikey,
+                timeout=settings.GEOCODER_TIMEOUT,
+                deadline=settings.GEOCODER_DEADLINE,
+                retries=settings.GEOCODER_RETRIES,
+                pool_size=settings.GEOCODER_POOL_SIZE,
+                failure_threshold=settings.GEOCODER_FAILURE_THRESHOLD,
+                recovery_timeout=settings.GEOCODER_RECOVERY_TIMEOUT,
+                rate_limit=settings.GEOCODER_RATE_LIMIT,
+            )
+        return _geocoders[apikey]
@@ -0,0 +1,193 @@
+import datetime
+import logging
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from requests import RequestException
+
+from .geocoder import GeocoderUnavailable, get_geocoder
+from .models import Place
+from .normalization import normalize_address
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND_REASON = 'Геокодер не нашёл адрес'
+# Точность полей координат Place
+COORDINATE_PRECISION = Decimal('0.000001')
+
+
+def enqueue_addresses(addresses):
+    """Ставит в очередь на геокодирование адреса, для которых ещё нет Place."""
+    # Разные написания одного адреса ставим в очередь один раз
+    addresses = {normalize_address(address): address for address in addresses if address}
+    if not addresses:
+        return 0
+    known_keys = set(
+        Place.objects.filter(canonical_key__in=addresses).values_list('canonical_key', flat=True)
+    )
+    new_places = [
+        Place(address=address, canonical_key=canonical_key, status=Place.PENDING)
+        for canonical_key, address in addresses.items()
+        if canonical_key not in known_keys
+    ]
+    Place.objects.bulk_create(new_places, ignore_conflicts=True)
+    return len(new_places)
+
+
+def get_retry_delay(attempts):
+    """Экспоненциальная пауза перед следующей попыткой: base, 2·base, 4·base… до максимума."""
+    delay = settings.GEOCODER_BACKOFF_BASE * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(delay, settings.GEOCODER_BACKOFF_MAX))
+
+
+def record_failure(place, reason):
+    place.attempts += 1
+    place.failure_reason = reason[:200]
+    place.next_attempt_at = timezone.now() + get_retry_delay(place.attempts)
+
+
+GEOCODED_FIELDS = [
+    'longitude', 'latitude', 'status', 'create_date',
+    'failure_reason', 'attempts', 'next_attempt_at', 'leased_until',
+]
+
+
+def fetch_place_location(place):
+    """Запрос к геокодеру без записи в базу: (координаты или None, ошибка или None)."""
+    try:
+        return get_geocoder().fetch_coordinates(place.address), None
+    except GeocoderUnavailable:
+        # Адрес до геокодера не дошёл, попытку ему не засчитываем
+        raise
+    except RequestException as e:
+        return None, e
+
+
+def apply_location(place, location, error=None):
+    """Переносит результат геокодера в место, не сохраняя его."""
+    if error is not None:
+        # Адрес остаётся в очереди, но следующая попытка — после паузы
+        logger.warning(f"Ошибка геокодера для адреса {place.address}: {error}")
+        record_failure(place, str(error))
+    elif location:
+        # Геокодер отдаёт строки, а из базы координаты читаются как Decimal:
+        # приводим сразу, чтобы свежие координаты можно было сравнивать с сохранёнными
+        place.longitude, place.latitude = (
+            Decimal(value).quantize(COORDINATE_PRECISION) for value in location
+        )
+        place.status = Place.RESOLVED
+        place.attempts = 0
+        place.failure_reason = ''
+        place.next_attempt_at = None
+    else:
+        logger.warning(f"Не удалось получить координаты для адреса {place.address} из API")
+        place.status = Place.FAILED
+        record_failure(place, NOT_FOUND_REASON)
+    place.create_date = timezone.now()
+    place.leased_until = None
+
+
+def get_due_places():
+    """Адреса, которые пора геокодировать: новые и ненайденные, у которых истекла пауза.
+
+    Адреса, которые сейчас геокодирует другой воркер, сюда не попадают.
+    """
+    now = timezone.now()
+    return Place.objects.filter(
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+        Q(leased_until__isnull=True) | Q(leased_until__lte=now),
+        status__in=[Place.PENDING, Place.FAILED],
+    )
+
+
+def claim_places(places):
+    """Забирает места в работу до GEOCODER_LEASE, возвращает забранные места.
+
+    Строки блокируются только на время пометки, транзакция сразу
+    фиксируется. Запросы к геокодеру идут уже без открытой транзакции:
+    пока аренда не истекла, get_due_places эти места не отдаёт.
+    """
+    with transaction.atomic():
+        claimed = list(places.select_for_update(skip_locked=True))
+        leased_until = timezone.now() + datetime.timedelta(seconds=settings.GEOCODER_LEASE)
+        Place.objects.filter(id__in=[place.id for place in claimed]).update(leased_until=leased_until)
+    for place in claimed:
+        place.leased_until = leased_until
+    return claimed
+
+
+def release_places(places):
+    """Возвращает забранные места в очередь, не засчитывая попытку."""
+    places = list(places)
+    Place.objects.filter(id__in=[place.id for place in places]).update(leased_until=None)
+    for place in places:
+        place.leased_until = None
+
+
+def geocode_place(place):
+    """Геокодирует забранное место и сохраняет результат."""
+    try:
+        location, error = fetch_place_location(place)
+    except BaseException:
+        release_places([place])
+        raise
+    apply_location(place, location, error)
+    place.save(update_fields=GEOCODED_FIELDS)
+    return place.status == Place.RESOLVED
+
+
+def wait_for_place(canonical_key):
+    """Ждёт, пока другой процесс запишет результат геокодирования, не дольше GEOCODER_DEADLINE."""
+    deadline = time.monotonic() + settings.GEOCODER_DEADLINE
+    while True:
+        place = Place.objects.filter(canonical_key=canonical_key).first()
+        if place is None or not place.is_leased or time.monotonic() > deadline:
+            return place
+        time.sleep(0.1)
+
+
+_flights = SingleFlight()
+
+
+def geocode_exclusively(canonical_key, wait=True):
+    """Геокодирует место не больше одного раза одновременно во всех потоках и процессах.
+
+    Потоки процесса ждут первого через SingleFlight, процессы — пока не
+    истечёт аренда места (см. claim_places). Место, которое не пора
+    геокодировать, возвращаем как есть, в API не ходим. С wait=False
+    занятое другим процессом место пропускаем и возвращаем None.
+    """
+    def geocode():
+        claimed = claim_places(get_due_places().filter(canonical_key=canonical_key))
+        if claimed:
+            geocode_place(claimed[0])
+            return claimed[0]
+        place = Place.objects.filter(canonical_key=canonical_key).first()
+        if place is not None and place.is_leased:
+            return wait_for_place(canonical_key) if wait else None
+        return place
+
+    return _flights.do(canonical_key, geocode)
+
+
+def geocode_pending_places(batch_size=50):
+    canonical_keys = list(
+        get_due_places().order_by('create_date').values_list('canonical_key', flat=True)[:batch_size]
+    )
+    processed = 0
+    for canonical_key in canonical_keys:
+        try:
+            place = geocode_exclusively(canonical_key, wait=False)
+        except GeocoderUnavailable as e:
+            # Предохранитель разомкнут или исчерпан лимит запросов:
+            # остальные адреса пачки тоже не пройдут
+            logger.warning(f"Проход геокодирования прерван: {e}")
+            break
+        if place is not None:
+            processed += 1
+    return processed
@@ -0,0 +1,133 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.models import Restaurant
+from foodcartapp.candidates import refresh_address_candidates, refresh_restaurant_candidates
+from foodcartapp.spatial import sync_restaurant_coordinates
+from places.cache import get_coordinate_cache
+from places.geocoder import GeocoderRateLimited, GeocoderUnavailable, get_geocoder
+from places.geocoding import (
+    GEOCODED_FIELDS, apply_location, claim_places, enqueue_addresses, fetch_place_location,
+    get_due_places, release_places,
+)
+from places.models import Place
+
+
+class Command(BaseCommand):
+    help = 'Массово геокодирует адреса мест и ресторанов без координат'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=8,
+            help='Сколько запросов к геокодеру выполнять параллельно',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help='Сколько адресов геокодировать и записывать за один проход',
+        )
+        parser.add_argument(
+            '--rate-limit', type=int, default=None,
+            help='Лимит запросов в секунду на время работы команды, по умолчанию GEOCODER_RATE_LIMIT',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Остановиться после стольких адресов',
+        )
+
+    def handle(self, *args, **options):
+        geocoder = get_geocoder()
+        if options['rate_limit'] is not None:
+            geocoder.budget.rate = options['rate_limit']
+
+        # Адреса ресторанов, которых ещё нет в таблице мест, ставим в очередь
+        restaurant_addresses = set(Restaurant.objects.values_list('address', flat=True))
+        enqueue_addresses(restaurant_addresses)
+        restaurant_keys = set(Restaurant.objects.exclude(address='').values_list('canonical_key', flat=True))
+
+        total = get_due_places().count()
+        if options['limit'] is not None:
+            total = min(total, options['limit'])
+        self.stdout.write(f'Адресов к геокодированию: {total}')
+
+        # Готовые адреса записываются после каждой пачки и больше не попадают
+        # в выборку, поэтому прерванную команду можно просто запустить снова
+        last_id = 0
+        processed = resolved = 0
+        started_at = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            while processed < total:
+                chunk_size = min(options['chunk_size'], total - processed)
+                chunk_processed, chunk_resolved, last_id, unavailable = self.geocode_chunk(
+                    executor, last_id, chunk_size, restaurant_keys,
+                )
+                processed += chunk_processed
+                resolved += chunk_resolved
+                self.report_progress(processed, resolved, total, started_at)
+
+                if isinstance(unavailable, GeocoderRateLimited):
+                    time.sleep(1)
+                elif unavailable:
+                    pause = settings.GEOCODER_RECOVERY_TIMEOUT
+                    self.stdout.write(f'Геокодер недоступен, пауза {pause:.0f} с')
+                    time.sleep(pause)
+                elif not chunk_processed:
+                    break
+
+        self.stdout.write(f'Статистика геокодера: {geocoder.get_stats()}')
+
+    def geocode_chunk(self, executor, last_id, chunk_size, restaurant_keys):
+        # Пачка забирается в работу короткой транзакцией: geocode_worker и
+        # вторая копия команды её пропустят, а запросы к геокодеру не держат
+        # блокировки строк
+        places = claim_places(
+            get_due_places()
+            .filter(id__gt=last_id)
+            .order_by('id')[:chunk_size]
+        )
+        if not places:
+            return 0, 0, last_id, None
+
+        geocoded_places = []
+        skipped_places = []
+        unavailable = None
+        futures = [(place, executor.submit(fetch_place_location, place)) for place in places]
+        for place, future in futures:
+            try:
+                location, error = future.result()
+            except GeocoderUnavailable as e:
+                # Адрес вернётся в очередь, его заберёт следующий проход
+                unavailable = e
+                skipped_places.append(place)
+                continue
+            apply_location(place, location, error)
+            geocoded_places.append(place)
+
+        with transaction.atomic():
+            Place.objects.bulk_update(geocoded_places, GEOCODED_FIELDS)
+            release_places(skipped_places)
+
+        # bulk_update не отправляет сигналы: кэш координат, координаты ресторанов
+        # и кандидатов заказов обновляем сами
+        get_coordinate_cache().update(geocoded_places)
+
+        resolved_places = [place for place in geocoded_places if place.status == Place.RESOLVED]
+        if any(place.canonical_key in restaurant_keys for place in resolved_places):
+            moved_restaurants = sync_restaurant_coordinates(resolved_places)
+            refresh_restaurant_candidates(restaurant.id for restaurant in moved_restaurants)
+        refresh_address_candidates(resolved_places)
+
+        next_id = last_id if unavailable else places[-1].id
+        return len(geocoded_places), len(resolved_places), next_id, unavailable
+
+    def report_progress(self, processed, resolved, total, started_at):
+        elapsed = time.monotonic() - started_at
+        speed = processed / elapsed if elapsed else 0
+        remaining = (total - processed) / speed if speed else 0
+        self.stdout.write(
+            f'Обработано {processed} из {total}, найдено {resolved}, '
+            f'{speed:.1f} адресов/с, осталось ~{remaining:.0f} с'
+        )
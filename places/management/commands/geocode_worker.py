@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order, Restaurant
+from places.geocoder import get_geocoder
+from places.geocoding import enqueue_addresses, geocode_pending_places
+from places.models import Place
+
+
+class Command(BaseCommand):
+    help = 'Фоновое геокодирование адресов заказов и ресторанов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Сколько адресов геокодировать за один проход',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать очередь один раз и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            enqueue_addresses(self.get_known_addresses())
+            processed = geocode_pending_places(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Геокодировано адресов: {processed}')
+                self.stdout.write(f'Статистика геокодера: {get_geocoder().get_stats()}')
+            if options['once']:
+                break
+            if processed < options['batch_size']:
+                time.sleep(options['interval'])
+
+    def get_known_addresses(self):
+        # Подстраховка: адреса, которые не попали в очередь при оформлении заказа.
+        # Берём только адреса без места, чтобы проход не рос вместе с числом заказов
+        known_keys = Place.objects.values('canonical_key')
+        order_addresses = (
+            Order.objects
+            .open()
+            .exclude(canonical_key__in=known_keys)
+            .values_list('address', flat=True)
+        )
+        restaurant_addresses = (
+            Restaurant.objects
+            .exclude(address='')
+            .exclude(canonical_key__in=known_keys)
+            .values_list('address', flat=True)
+        )
+        return set(order_addresses) | set(restaurant_addresses)
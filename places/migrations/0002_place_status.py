@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+def mark_resolved_places(apps, schema_editor):
+    Place = apps.get_model('places', 'Place')
+    Place.objects.filter(
+        latitude__isnull=False, longitude__isnull=False
+    ).update(status='fnd')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='status',
+            field=models.CharField(choices=[('pnd', 'Ожидает геокодирования'), ('fnd', 'Координаты определены'), ('err', 'Адрес не найден')], db_index=True, default='pnd', max_length=3, verbose_name='Статус геокодирования'),
+        ),
+        migrations.AlterField(
+            model_name='place',
+            name='address',
+            field=models.CharField(db_index=True, max_length=200, unique=True, verbose_name='Адрес'),
+        ),
+        migrations.RunPython(mark_resolved_places, migrations.RunPython.noop),
+    ]
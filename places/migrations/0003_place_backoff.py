@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0002_place_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Неудачных попыток подряд'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='failure_reason',
+            field=models.CharField(blank=True, max_length=200, verbose_name='Причина неудачи'),
+        ),
+        migrations.AddField(
+            model_name='place',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Следующая попытка'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+from places.migrations._frozen_normalization import normalize_address
+
+
+def merge_duplicate_places(apps, schema_editor):
+    Place = apps.get_model('places', 'Place')
+    places_by_key = {}
+    for place in Place.objects.order_by('id'):
+        place.canonical_key = normalize_address(place.address)
+        places_by_key.setdefault(place.canonical_key, []).append(place)
+
+    duplicate_ids = []
+    kept_places = []
+    for places in places_by_key.values():
+        # Оставляем место с координатами, среди равных — самое свежее
+        places.sort(key=lambda place: (place.status == 'fnd', place.create_date), reverse=True)
+        kept_places.append(places[0])
+        duplicate_ids.extend(place.id for place in places[1:])
+
+    Place.objects.filter(id__in=duplicate_ids).delete()
+    Place.objects.bulk_update(kept_places, ['canonical_key'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0003_place_backoff'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='canonical_key',
+            field=models.CharField(default='', editable=False, max_length=200, verbose_name='Канонический адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(merge_duplicate_places, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='place',
+            name='canonical_key',
+            field=models.CharField(editable=False, max_length=200, unique=True, verbose_name='Канонический адрес'),
+        ),
+    ]
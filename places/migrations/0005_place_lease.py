@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('places', '0004_place_canonical_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='leased_until',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Геокодируется до'),
+        ),
+    ]
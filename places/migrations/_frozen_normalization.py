@@ -0,0 +1,40 @@
+"""Копия places.normalization на момент миграции 0004 для миграций данных.
+
+Миграция должна давать тот же результат, даже если правила нормализации
+потом поменяются, поэтому этот модуль не правят. Загрузчик миграций
+пропускает модули с подчёркиванием в начале имени.
+"""
+import re
+
+DROPPED_WORDS = {
+    'г', 'гор', 'город',
+    'ул', 'улица',
+    'д', 'дом',
+}
+WORD_ALIASES = {
+    'пр-т': 'пр-т', 'пр': 'пр-т', 'просп': 'пр-т', 'проспект': 'пр-т',
+    'пер': 'пер', 'переулок': 'пер',
+    'ш': 'ш', 'шоссе': 'ш',
+    'б-р': 'б-р', 'бул': 'б-р', 'бульвар': 'б-р',
+    'пл': 'пл', 'площадь': 'пл',
+    'наб': 'наб', 'набережная': 'наб',
+    'пр-д': 'пр-д', 'проезд': 'пр-д',
+    'мкр': 'мкр', 'микрорайон': 'мкр',
+    'обл': 'обл', 'область': 'обл',
+    'к': 'к', 'корп': 'к', 'корпус': 'к',
+    'стр': 'стр', 'строение': 'стр',
+    'кв': 'кв', 'квартира': 'кв',
+}
+WORD_PATTERN = re.compile(r'[^\W_]+(?:-[^\W_]+)*')
+DIGIT_BOUNDARY_PATTERN = re.compile(r'(?<=\d)(?=[^\W\d_])|(?<=[^\W\d_])(?=\d)')
+
+
+def normalize_address(address):
+    text = address.casefold().replace('ё', 'е')
+    text = DIGIT_BOUNDARY_PATTERN.sub(' ', text)
+    words = []
+    for word in WORD_PATTERN.findall(text):
+        if word in DROPPED_WORDS:
+            continue
+        words.append(WORD_ALIASES.get(word, word))
+    return ' '.join(words) or ' '.join(text.split())
@@ -1,19 +1,71 @@
 from django.db import models
 from django.utils import timezone
 
+from .normalization import normalize_address
+
+
+class PlaceQuerySet(models.QuerySet):
+    def for_addresses(self, addresses):
+        return self.filter(
+            canonical_key__in={normalize_address(address) for address in addresses if address}
+        )
+
+    def map_addresses(self, addresses):
+        """Места по адресам как их написали: {адрес: Place} с поиском по каноническому ключу."""
+        addresses = {address for address in addresses if address}
+        places = {place.canonical_key: place for place in self.for_addresses(addresses)}
+        return {
+            address: places[normalize_address(address)]
+            for address in addresses
+            if normalize_address(address) in places
+        }
+
 
 class Place(models.Model):
+    PENDING = 'pnd'
+    RESOLVED = 'fnd'
+    FAILED = 'err'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает геокодирования'),
+        (RESOLVED, 'Координаты определены'),
+        (FAILED, 'Адрес не найден'),
+    ]
+
     address = models.CharField(
         verbose_name='Адрес', max_length=200, unique=True, db_index=True
     )
+    canonical_key = models.CharField(
+        verbose_name='Канонический адрес', max_length=200, unique=True, editable=False
+    )
     longitude = models.DecimalField(
         verbose_name='Долгота', max_digits=9, decimal_places=6, null=True, blank=True
     )
     latitude = models.DecimalField(
         verbose_name='Широта', max_digits=9, decimal_places=6, null=True, blank=True
     )
+    status = models.CharField(
+        verbose_name='Статус геокодирования',
+        max_length=3,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True
+    )
     create_date = models.DateTimeField(
         verbose_name='Дата изменения', default=timezone.now)
+    failure_reason = models.CharField(
+        verbose_name='Причина неудачи', max_length=200, blank=True
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name='Неудачных попыток подряд', default=0
+    )
+    next_attempt_at = models.DateTimeField(
+        verbose_name='Следующая попытка', null=True, blank=True, db_index=True
+    )
+    leased_until = models.DateTimeField(
+        verbose_name='Геокодируется до', null=True, blank=True
+    )
+
+    objects = PlaceQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'место'
@@ -21,3 +73,24 @@ class Place(models.Model):
 
     def __str__(self):
         return self.address
+
+    def save(self, *args, **kwargs):
+        self.canonical_key = normalize_address(self.address)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'address' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'canonical_key'}
+        super().save(*args, **kwargs)
+
+    @property
+    def in_backoff(self):
+        return self.next_attempt_at is not None and self.next_attempt_at > timezone.now()
+
+    @property
+    def is_leased(self):
+        return self.leased_until is not None and self.leased_until > timezone.now()
+
+    @property
+    def coordinates(self):
+        if self.status != self.RESOLVED:
+            return None
+        return self.latitude, self.longitude
@@ -0,0 +1,45 @@
+import re
+
+# Служебные слова, которые не меняют адрес: «г. Москва» и «Москва» — одно и то же.
+# «ул.» тоже отбрасываем: улица — тип по умолчанию, его часто не пишут
+DROPPED_WORDS = {
+    'г', 'гор', 'город',
+    'ул', 'улица',
+    'д', 'дом',
+}
+# Остальные типы приводим к одному сокращению, чтобы не склеить
+# «Ленинский проспект» с «Ленинским переулком»
+WORD_ALIASES = {
+    'пр-т': 'пр-т', 'пр': 'пр-т', 'просп': 'пр-т', 'проспект': 'пр-т',
+    'пер': 'пер', 'переулок': 'пер',
+    'ш': 'ш', 'шоссе': 'ш',
+    'б-р': 'б-р', 'бул': 'б-р', 'бульвар': 'б-р',
+    'пл': 'пл', 'площадь': 'пл',
+    'наб': 'наб', 'набережная': 'наб',
+    'пр-д': 'пр-д', 'проезд': 'пр-д',
+    'мкр': 'мкр', 'микрорайон': 'мкр',
+    'обл': 'обл', 'область': 'обл',
+    'к': 'к', 'корп': 'к', 'корпус': 'к',
+    'стр': 'стр', 'строение': 'стр',
+    'кв': 'кв', 'квартира': 'кв',
+}
+
+WORD_PATTERN = re.compile(r'[^\W_]+(?:-[^\W_]+)*')
+# Граница цифр и букв: «д.1к2» и «д 1 к 2» дают одни и те же слова
+DIGIT_BOUNDARY_PATTERN = re.compile(r'(?<=\d)(?=[^\W\d_])|(?<=[^\W\d_])(?=\d)')
+
+
+def normalize_address(address):
+    """Канонический ключ адреса: регистр, ё, пробелы, пунктуация и сокращения не важны.
+
+    >>> normalize_address('г. Москва, ул. Тверская, д.1')
+    'москва тверская 1'
+    """
+    text = address.casefold().replace('ё', 'е')
+    text = DIGIT_BOUNDARY_PATTERN.sub(' ', text)
+    words = []
+    for word in WORD_PATTERN.findall(text):
+        if word in DROPPED_WORDS:
+            continue
+        words.append(WORD_ALIASES.get(word, word))
+    return ' '.join(words) or ' '.join(text.split())
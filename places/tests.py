@@ -0,0 +1,230 @@
+import datetime
+from unittest import mock
+
+import requests
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from foodcartapp.models import Order, Restaurant
+from .geocoder import CircuitBreaker, GeocoderRateLimited, GeocoderUnavailable, YandexGeocoder
+from .geocoding import claim_places, geocode_exclusively, get_due_places
+from .management.commands.geocode_worker import Command as GeocodeWorkerCommand
+from .models import Place
+from .normalization import normalize_address
+from .touches import PlaceTouchBuffer
+
+
+def make_response(pos='37.62 55.75'):
+    response = mock.Mock()
+    response.json.return_value = {'response': {'GeoObjectCollection': {'featureMember': [
+        {'GeoObject': {'Point': {'pos': pos}}},
+    ]}}}
+    return response
+
+
+class NormalizeAddressTest(SimpleTestCase):
+    def test_spellings_of_one_address(self):
+        spellings = ['Москва, Тверская 1', 'москва тверская, 1 ', 'г. Москва, ул. Тверская, д.1']
+        self.assertEqual({normalize_address(address) for address in spellings}, {'москва тверская 1'})
+
+    def test_building_number(self):
+        self.assertEqual(normalize_address('Москва, Тверская, д.1к2'), normalize_address('Москва, Тверская 1 к 2'))
+        self.assertEqual(normalize_address('Москва, Тверская, 1 корп. 2'), 'москва тверская 1 к 2')
+
+    def test_street_types_stay_apart(self):
+        avenue = normalize_address('Москва, Ленинский проспект, 1')
+        lane = normalize_address('Москва, Ленинский пер., 1')
+        self.assertEqual(avenue, 'москва ленинский пр-т 1')
+        self.assertEqual(lane, 'москва ленинский пер 1')
+        self.assertEqual(normalize_address('Москва, Ленинский пр-т, 1'), avenue)
+        self.assertNotEqual(avenue, lane)
+
+    def test_case_and_yo(self):
+        self.assertEqual(normalize_address('МОСКВА, Солёная ул.'), normalize_address('москва, соленая'))
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def test_breaker_cycle(self):
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Первый запрос после таймаута — проба, остальные ждут её результата
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    def test_failed_probe_opens_breaker_again(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_open_breaker_rejects_until_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class YandexGeocoderBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.geocoder = YandexGeocoder('key', retries=0, failure_threshold=1, recovery_timeout=0)
+        self.geocoder.session.get = mock.Mock(side_effect=requests.ConnectionError)
+        with self.assertRaises(requests.ConnectionError):
+            self.geocoder.fetch_coordinates('Москва')
+        self.assertEqual(self.geocoder.breaker.state, CircuitBreaker.OPEN)
+
+    def test_recovers_after_successful_probe(self):
+        self.geocoder.session.get = mock.Mock(return_value=make_response())
+        self.assertEqual(self.geocoder.fetch_coordinates('Москва'), ('37.62', '55.75'))
+        self.assertEqual(self.geocoder.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_throttled_probe_is_released(self):
+        self.geocoder.session.get = mock.Mock(return_value=make_response())
+        with mock.patch.object(self.geocoder.budget, 'acquire', side_effect=GeocoderRateLimited):
+            with self.assertRaises(GeocoderRateLimited):
+                self.geocoder.fetch_coordinates('Москва')
+        self.assertEqual(self.geocoder.breaker.state, CircuitBreaker.OPEN)
+        self.geocoder.session.get.assert_not_called()
+
+        # Следующий запрос снова становится пробой и закрывает предохранитель
+        self.assertEqual(self.geocoder.fetch_coordinates('Москва'), ('37.62', '55.75'))
+        self.assertEqual(self.geocoder.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_unexpected_error_releases_probe(self):
+        with mock.patch.object(self.geocoder.budget, 'acquire', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                self.geocoder.fetch_coordinates('Москва')
+        self.assertEqual(self.geocoder.breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(self.geocoder.breaker.allow_request())
+
+    def test_rejects_while_probe_in_flight(self):
+        self.assertTrue(self.geocoder.breaker.allow_request())
+        with self.assertRaises(GeocoderUnavailable):
+            self.geocoder.fetch_coordinates('Москва')
+
+
+class PlaceLeaseTest(TestCase):
+    def setUp(self):
+        self.place = Place.objects.create(address='Псков, ул. Ленина, 5')
+        self.geocoder = mock.Mock()
+        patcher = mock.patch('places.geocoding.get_geocoder', return_value=self.geocoder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_claimed_place_is_not_due(self):
+        self.assertEqual(claim_places(get_due_places()), [self.place])
+        self.assertFalse(get_due_places().exists())
+        self.assertEqual(claim_places(get_due_places()), [])
+        self.assertIsNone(geocode_exclusively(self.place.canonical_key, wait=False))
+        self.geocoder.fetch_coordinates.assert_not_called()
+
+    def test_geocoder_is_called_after_claim(self):
+        def fetch_coordinates(address):
+            # К моменту запроса аренда уже записана, строка не заблокирована
+            self.assertTrue(Place.objects.get(pk=self.place.pk).is_leased)
+            return '28.33', '57.81'
+
+        self.geocoder.fetch_coordinates.side_effect = fetch_coordinates
+        place = geocode_exclusively(self.place.canonical_key)
+
+        place.refresh_from_db()
+        self.assertEqual(place.status, Place.RESOLVED)
+        self.assertIsNone(place.leased_until)
+        # Найденный адрес больше не геокодируем
+        self.assertEqual(geocode_exclusively(self.place.canonical_key), place)
+        self.assertEqual(self.geocoder.fetch_coordinates.call_count, 1)
+
+    def test_unavailable_geocoder_releases_place(self):
+        self.geocoder.fetch_coordinates.side_effect = GeocoderUnavailable('нет связи')
+        with self.assertRaises(GeocoderUnavailable):
+            geocode_exclusively(self.place.canonical_key)
+
+        self.place.refresh_from_db()
+        self.assertIsNone(self.place.leased_until)
+        self.assertEqual(self.place.attempts, 0)
+        self.assertTrue(get_due_places().exists())
+
+
+class GeocodeWorkerTest(TestCase):
+    def test_known_addresses_skip_existing_places(self):
+        Place.objects.create(address='Псков, ул. Ленина, 1')
+        for address in ['г. Псков, ул. Ленина, д. 1', 'Псков, ул. Ленина, 2']:
+            Order.objects.create(
+                firstname='Иван', lastname='Петров', phonenumber='+79261234567', address=address,
+            )
+        Restaurant.objects.create(name='Ресторан', address='Псков, ул. Ленина, 3')
+        Restaurant.objects.create(name='Без адреса', address='')
+        Place.objects.filter(address='Псков, ул. Ленина, 3').delete()
+
+        self.assertEqual(
+            GeocodeWorkerCommand().get_known_addresses(),
+            {'Псков, ул. Ленина, 2', 'Псков, ул. Ленина, 3'},
+        )
+
+
+class PlaceTouchBufferTest(TestCase):
+    def setUp(self):
+        self.buffer = PlaceTouchBuffer(batch_size=3, interval=5)
+        # Таймеры не запускаем, flush вызываем сами
+        patcher = mock.patch.object(self.buffer, '_schedule')
+        self.schedule = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_interval_trigger(self):
+        self.buffer.touch(['Псков, ул. Ленина, 1', 'г. Псков, ул. Ленина, д. 1'])
+        # Два написания одного адреса — одно касание
+        self.assertEqual(len(self.buffer._touches), 1)
+        self.schedule.assert_called_once_with(5)
+
+    def test_size_trigger(self):
+        self.buffer.touch(['Псков, ул. Ленина, 1', 'Псков, ул. Ленина, 2'])
+        self.buffer.touch(['Псков, ул. Ленина, 3'])
+        self.schedule.assert_called_with(0)
+
+    def test_flush_upserts_places(self):
+        touched_before = timezone.now() - datetime.timedelta(days=1)
+        place = Place.objects.create(
+            address='Псков, ул. Ленина, 1', status=Place.RESOLVED, latitude=57.81, longitude=28.33,
+            create_date=touched_before,
+        )
+        self.buffer.touch(['г. Псков, ул. Ленина, д. 1', 'Псков, ул. Ленина, 2'])
+        self.assertEqual(self.buffer.flush(), 2)
+
+        place.refresh_from_db()
+        self.assertGreater(place.create_date, touched_before)
+        self.assertEqual(place.status, Place.RESOLVED)
+        self.assertEqual(place.address, 'Псков, ул. Ленина, 1')
+        self.assertEqual(Place.objects.get(address='Псков, ул. Ленина, 2').status, Place.PENDING)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_conflicting_row_is_dropped(self):
+        # Место записано со старым ключом: адрес тот же, ключ другой
+        Place.objects.create(address='Псков, ул. Ленина, 1')
+        Place.objects.filter(address='Псков, ул. Ленина, 1').update(canonical_key='старый ключ')
+        self.buffer.touch(['Псков, ул. Ленина, 1', 'Псков, ул. Ленина, 2'])
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertTrue(Place.objects.filter(address='Псков, ул. Ленина, 2').exists())
+        self.assertEqual(self.buffer._touches, {})
+
+    def test_failed_flush_is_retried_then_dropped(self):
+        self.buffer.touch(['Псков, ул. Ленина, 1'])
+        with mock.patch.object(Place.objects, 'bulk_create', side_effect=OperationalError):
+            for _ in range(self.buffer.max_attempts - 1):
+                with self.assertRaises(OperationalError):
+                    self.buffer.flush()
+                self.assertEqual(len(self.buffer._touches), 1)
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer._touches, {})
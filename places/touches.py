@@ -0,0 +1,157 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .models import Place
+from .normalization import normalize_address
+
+logger = logging.getLogger(__name__)
+
+
+class PlaceTouchBuffer:
+    """Копит «касания» адресов и записывает их пачкой.
+
+    Вместо update_or_create на каждый заказ одна вставка
+    INSERT ... ON CONFLICT (canonical_key) DO UPDATE SET create_date на всю пачку:
+    новые адреса попадают в очередь геокодирования, у известных
+    обновляется только дата. Пачка уходит в базу из фонового потока,
+    когда набралось batch_size адресов или прошло interval секунд.
+    Адрес, который не записался max_attempts раз подряд, отбрасывается,
+    чтобы не держать остальные: его снова подберёт geocode_worker.
+    """
+
+    def __init__(self, batch_size=500, interval=5, max_attempts=3):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self._touches = {}
+        self._failures = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def touch(self, addresses):
+        now = timezone.now()
+        with self._lock:
+            for address in addresses:
+                if address:
+                    # Ключ — канонический адрес: в одной вставке ON CONFLICT
+                    # строка не может обновляться дважды
+                    self._touches[normalize_address(address)] = (address, now)
+            if not self._touches:
+                return
+            if len(self._touches) >= self.batch_size:
+                self._schedule(0)
+            elif self._timer is None:
+                self._schedule(self.interval)
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._flush_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось записать пачку адресов: {e}")
+        finally:
+            # У потока таймера своё соединение с базой, закрываем его вместе с потоком
+            connection.close()
+
+    def flush(self):
+        with self._lock:
+            touches, self._touches = self._touches, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not touches:
+            return 0
+
+        try:
+            return self._write(touches)
+        except IntegrityError:
+            # Пачку сломала строка, которая нарушает другой уникальный индекс
+            # (например, address после смены правил нормализации): пишем
+            # адреса по одному, а такие строки отбрасываем — повтор их не починит
+            logger.warning("Пачка адресов не записалась, записываем адреса по одному")
+            written = 0
+            failed = {}
+            for canonical_key, touch in touches.items():
+                try:
+                    written += self._write({canonical_key: touch})
+                except IntegrityError as e:
+                    logger.error(f"Адрес {touch[0]} отброшен: {e}")
+                except DatabaseError:
+                    failed[canonical_key] = touch
+            if failed:
+                self._requeue(failed)
+            return written
+        except DatabaseError:
+            self._requeue(touches)
+            raise
+
+    def _write(self, touches):
+        # Сортировка по ключу даёт одинаковый порядок блокировок строк
+        # у параллельных процессов и исключает взаимные блокировки
+        places = [
+            Place(
+                address=address, canonical_key=canonical_key,
+                create_date=touched_at, status=Place.PENDING,
+            )
+            for canonical_key, (address, touched_at) in sorted(touches.items())
+        ]
+        with transaction.atomic():
+            Place.objects.bulk_create(
+                places,
+                update_conflicts=True,
+                unique_fields=['canonical_key'],
+                update_fields=['create_date'],
+            )
+        with self._lock:
+            for canonical_key in touches:
+                self._failures.pop(canonical_key, None)
+        return len(places)
+
+    def _requeue(self, touches):
+        """Возвращает адреса в буфер; после max_attempts неудач подряд адрес отбрасывается."""
+        with self._lock:
+            for canonical_key, touch in touches.items():
+                self._failures[canonical_key] = self._failures.get(canonical_key, 0) + 1
+                if self._failures[canonical_key] >= self.max_attempts:
+                    del self._failures[canonical_key]
+                    logger.error(f"Адрес {touch[0]} отброшен после {self.max_attempts} неудачных записей")
+                    continue
+                # Более свежие касания не затираем
+                self._touches.setdefault(canonical_key, touch)
+            if self._touches and self._timer is None:
+                self._schedule(self.interval)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_touch_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = PlaceTouchBuffer(
+                batch_size=settings.PLACE_TOUCH_BATCH_SIZE,
+                interval=settings.PLACE_TOUCH_INTERVAL,
+            )
+            # Остаток буфера дописываем при остановке процесса; если процесс
+            # упадёт, адреса заказов подберёт проход geocode_worker
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def touch_addresses(addresses):
+    """Отмечает адреса заказов после фиксации транзакции, без записи в places на горячем пути."""
+    addresses = list(addresses)
+    transaction.on_commit(lambda: get_touch_buffer().touch(addresses))
@@ -1,3 +1,242 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from foodcartapp.candidates import rebuild_order_candidates
+from foodcartapp.models import Order, OrderItem, Product, Restaurant, RestaurantMenuItem
+from places.cache import get_coordinate_cache
+from places.models import Place
+from restaurateur.views import OrderFilter, fetch_order_changes
+
+
+class ViewOrdersQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='manager', is_staff=True)
+        cls.products = [
+            Product.objects.create(name=f'Бургер {number}', price=100, image='burger.jpg')
+            for number in range(3)
+        ]
+        for number in range(3):
+            address = f'Москва, ресторан {number}'
+            Place.objects.create(
+                address=address, latitude=55.75 + number / 100, longitude=37.62,
+                status=Place.RESOLVED,
+            )
+            restaurant = Restaurant.objects.create(name=f'Ресторан {number}', address=address)
+            for product in cls.products:
+                RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def create_orders(self, count):
+        orders = []
+        for number in range(count):
+            address = f'Москва, клиент {Order.objects.count()}'
+            Place.objects.create(
+                address=address, latitude=55.7, longitude=37.6, status=Place.RESOLVED,
+            )
+            order = Order.objects.create(
+                firstname='Иван', lastname='Петров', phonenumber='+79261234567', address=address,
+            )
+            for product in self.products[:number % 3 + 1]:
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+            orders.append(order)
+        # Обработчики on_commit в TestCase не срабатывают, кандидатов записываем сами
+        self.assertTrue(rebuild_order_candidates(order.id for order in orders))
+
+    def count_page_queries(self):
+        # Сравниваем страницы с холодным кэшем координат: промахи читаются одним запросом
+        get_coordinate_cache().forget(Place.objects.values_list('canonical_key', flat=True))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_queries_do_not_depend_on_orders_count(self):
+        self.create_orders(1)
+        # Первый запрос строит индексы процесса, их не учитываем
+        self.count_page_queries()
+        queries_for_one_order = self.count_page_queries()
+
+        self.create_orders(20)
+        self.assertEqual(self.count_page_queries(), queries_for_one_order)
+
+    def test_orders_page_does_not_write(self):
+        self.create_orders(1)
+        order = Order.objects.get()
+        Order.objects.filter(pk=order.pk).update(restaurant=Restaurant.objects.first())
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('restaurateur:view_orders'))
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        # Сессия пользователя может продлеваться, заказы — никогда
+        self.assertFalse([sql for sql in writes if 'foodcartapp_order' in sql])
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.UNPROCESSING)
+
+
+class OrdersPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='manager', is_staff=True)
+        cls.restaurants = [
+            Restaurant.objects.create(name=f'Ресторан {number}', address=f'Тверь, ресторан {number}')
+            for number in range(2)
+        ]
+        cls.day = timezone.make_aware(datetime.datetime(2024, 5, 1, 12))
+        for number in range(9):
+            # Первые пять новых заказов созданы в одно время и не влезают в одну страницу
+            if number < 5:
+                status, days = Order.UNPROCESSING, 0
+            else:
+                status, days = [Order.PROCESSING, Order.IN_DELEVERY][number % 2], number % 3
+            order = Order.objects.create(
+                firstname='Иван', lastname='Петров', phonenumber='+79261234567',
+                address=f'Тверь, клиент {number}', status=status,
+                payment_method=Order.PAYMENT_METHODS[number % 2][0],
+                restaurant=cls.restaurants[number % 2] if number % 3 else None,
+            )
+            Order.objects.filter(pk=order.pk).update(
+                registered_at=cls.day + datetime.timedelta(days=days),
+            )
+        for status in [Order.ORDER_CLOSED, Order.ORDER_CANCELED]:
+            Order.objects.create(
+                firstname='Иван', lastname='Петров', phonenumber='+79261234567',
+                address='Тверь, клиент', status=status,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.manager)
+
+    def walk_pages(self, query=''):
+        order_ids = []
+        url = f'{reverse("restaurateur:view_orders")}?{query}'
+        with mock.patch('restaurateur.views.ORDERS_PAGE_SIZE', 2):
+            while url:
+                # Курсор, который не продвигается, не должен зациклить тест
+                self.assertLess(len(order_ids), 20)
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                page_ids = [order.id for order in response.context['orders']]
+                self.assertLessEqual(len(page_ids), 2)
+                order_ids.extend(page_ids)
+                next_page_query = response.context['next_page_query']
+                url = next_page_query and f'{reverse("restaurateur:view_orders")}?{next_page_query}'
+        return order_ids
+
+    def test_pages_cover_orders_once(self):
+        expected_ids = list(
+            Order.objects.exclude(status__in=[Order.ORDER_CLOSED, Order.ORDER_CANCELED])
+            .order_by('status', 'registered_at', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(len(expected_ids), 9)
+        self.assertEqual(self.walk_pages(), expected_ids)
+
+    def test_pages_keep_filter(self):
+        restaurant = self.restaurants[0]
+        expected_ids = list(
+            Order.objects.filter(restaurant=restaurant)
+            .order_by('status', 'registered_at', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.walk_pages(f'restaurant={restaurant.id}'), expected_ids)
+
+    def test_tampered_cursor_redirects(self):
+        with mock.patch('restaurateur.views.ORDERS_PAGE_SIZE', 2):
+            response = self.client.get(reverse('restaurateur:view_orders'))
+            cursor = response.context['next_page_query'].split('after=')[1]
+            response = self.client.get(reverse('restaurateur:view_orders'), {'after': cursor[:-1] + 'x'})
+        self.assertRedirects(response, reverse('restaurateur:view_orders'))
+
+    def filter_orders(self, orders, data):
+        order_filter = OrderFilter(data)
+        self.assertTrue(order_filter.is_valid(), order_filter.errors)
+        return set(order_filter.filter(orders).values_list('id', flat=True))
+
+    def test_filters(self):
+        orders = Order.objects.exclude(status__in=[Order.ORDER_CLOSED, Order.ORDER_CANCELED])
+        second_day = (self.day + datetime.timedelta(days=1)).date()
+        cases = [
+            ({'status': Order.PROCESSING}, orders.filter(status=Order.PROCESSING)),
+            ({'payment_method': 'cash'}, orders.filter(payment_method='cash')),
+            ({'restaurant': self.restaurants[1].id}, orders.filter(restaurant=self.restaurants[1])),
+            ({'registered_from': second_day}, orders.filter(registered_at__gt=self.day)),
+            ({'registered_to': second_day}, orders.filter(registered_at__lt=self.day + datetime.timedelta(days=2))),
+            (
+                {'registered_from': second_day, 'registered_to': second_day},
+                orders.filter(registered_at=self.day + datetime.timedelta(days=1)),
+            ),
+        ]
+        for data, expected in cases:
+            with self.subTest(data=data):
+                expected_ids = set(expected.values_list('id', flat=True))
+                self.assertTrue(expected_ids)
+                self.assertEqual(self.filter_orders(orders, data), expected_ids)
+
+
+class OrdersFeedTest(TestCase):
+    def fetch(self, watermark, sent_versions):
+        return fetch_order_changes(watermark, sent_versions, OrderFilter({}), '/manager/orders/')
+
+    def test_late_commit_is_not_lost(self):
+        watermark = timezone.now()
+        sent_versions = {}
+        order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79261234567', address='Москва',
+        )
+        changes, watermark = self.fetch(watermark, sent_versions)
+        self.assertEqual([change['id'] for change in changes], [order.id])
+
+        # Заказ из транзакции, зафиксированной позже, с отметкой раньше отправленных
+        late_order = Order.objects.create(
+            firstname='Пётр', lastname='Иванов', phonenumber='+79261234568', address='Москва',
+        )
+        Order.objects.filter(pk=late_order.pk).update(
+            updated_at=watermark - datetime.timedelta(seconds=5),
+        )
+        changes, watermark = self.fetch(watermark, sent_versions)
+        self.assertEqual([change['id'] for change in changes], [late_order.id])
+
+        # Уже отправленные версии повторно не приходят
+        self.assertEqual(self.fetch(watermark, sent_versions)[0], [])
+
+    def test_geocoded_order_is_sent_again(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        Place.objects.create(
+            address='Псков, Рижский пр., 1', latitude=57.81, longitude=28.3, status=Place.RESOLVED,
+        )
+        restaurant = Restaurant.objects.create(name='Ресторан', address='Псков, Рижский пр., 1')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79261234567',
+            address='Псков, Рижский пр., 30',
+        )
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        get_coordinate_cache().forget(Place.objects.values_list('canonical_key', flat=True))
+
+        sent_versions = {}
+        changes, watermark = self.fetch(timezone.now() - datetime.timedelta(seconds=1), sent_versions)
+        self.assertEqual([change['id'] for change in changes], [order.id])
+
+        # Адрес заказа геокодирован: у заказа появились кандидаты, лента отправляет его снова
+        with self.captureOnCommitCallbacks(execute=True):
+            Place.objects.create(
+                address='Псков, Рижский пр., 30', latitude=57.82, longitude=28.3, status=Place.RESOLVED,
+            )
+        changes, watermark = self.fetch(watermark, sent_versions)
+        self.assertEqual([change['id'] for change in changes], [order.id])
 
-# Create your tests here.
+        # Пересчёт без изменений заказ не трогает
+        rebuild_order_candidates([order.id])
+        self.assertEqual(self.fetch(watermark, sent_versions)[0], [])
@@ -1,21 +1,40 @@
+import datetime
+import json
 import logging
+import time
 
 from django import forms
-from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
-from django.db.models import Sum, F, Q
+from django.core import signing
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
-from django.urls import reverse_lazy
+from django.template.loader import render_to_string
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.views import View
 
+from foodcartapp.candidates import prefetch_candidates
 from foodcartapp.models import Order, Product, Restaurant
-from foodcartapp.serializers import process_orders, process_restaurants
-from places.models import Place
+from foodcartapp.serializers import process_orders
+from foodcartapp.snapshot import get_snapshot
+from places.cache import get_coordinate_cache
+from places.geocoder import get_geocoder
 
 logger = logging.getLogger(__name__)
 
+ORDERS_PAGE_SIZE = 50
+ORDERS_CURSOR_SALT = 'restaurateur.orders'
+EXCLUDED_ORDER_STATUSES = [Order.ORDER_CLOSED, Order.ORDER_CANCELED]
+ORDERS_FEED_BATCH_SIZE = 100
+ORDERS_FEED_DURATION = 25
+ORDERS_FEED_POLL_INTERVAL = 2
+ORDERS_FEED_RETRY_MS = 1000
+# Сколько ждём заказы, зафиксированные позже своей отметки updated_at
+ORDERS_FEED_OVERLAP = datetime.timedelta(seconds=60)
+
 
 class Login(forms.Form):
     username = forms.CharField(
@@ -72,12 +91,14 @@ def is_manager(user):
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_products(request):
     restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    products = list(Product.objects.select_related('category'))
+    # Доступность берём из общего для воркеров снимка, а не из RestaurantMenuItem
+    snapshot = get_snapshot()
+    restaurant_ids = [restaurant.id for restaurant in restaurants]
 
     products_with_restaurant_availability = []
     for product in products:
-        availability = {item.restaurant_id: item.availability for item in product.menu_items.all()}
-        ordered_availability = [availability.get(restaurant.id, False) for restaurant in restaurants]
+        ordered_availability = snapshot.get_availability(product.id, restaurant_ids)
 
         products_with_restaurant_availability.append(
             (product, ordered_availability)
@@ -96,27 +117,239 @@ def view_restaurants(request):
     })
 
 
+class OrderFilter(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'Все')] + [
+            (code, name) for code, name in Order.STATUS_CHOICES
+            if code not in EXCLUDED_ORDER_STATUSES
+        ],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    payment_method = forms.ChoiceField(
+        label='Оплата', required=False,
+        choices=[('', 'Любая')] + Order.PAYMENT_METHODS,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан', required=False, empty_label='Любой',
+        queryset=Restaurant.objects.order_by('name'),
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    registered_from = forms.DateField(
+        label='Создан с', required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    registered_to = forms.DateField(
+        label='по', required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+
+    def filter(self, orders):
+        filters = self.cleaned_data
+        if filters['status']:
+            orders = orders.filter(status=filters['status'])
+        if filters['payment_method']:
+            orders = orders.filter(payment_method=filters['payment_method'])
+        if filters['restaurant']:
+            orders = orders.filter(restaurant=filters['restaurant'])
+        # Границы дня переводим во время, чтобы работал индекс по registered_at
+        if filters['registered_from']:
+            orders = orders.filter(registered_at__gte=start_of_day(filters['registered_from']))
+        if filters['registered_to']:
+            next_day = filters['registered_to'] + datetime.timedelta(days=1)
+            orders = orders.filter(registered_at__lt=start_of_day(next_day))
+        return orders
+
+
+def start_of_day(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+def encode_orders_cursor(order):
+    return signing.dumps(
+        [order.status, order.registered_at.isoformat(), order.id],
+        salt=ORDERS_CURSOR_SALT,
+    )
+
+
+def paginate_orders(orders, cursor):
+    """Страница заказов после курсора по ключу (status, registered_at, id).
+
+    Каждая страница — диапазонное чтение по составному индексу, поэтому
+    её стоимость не зависит от того, сколько заказов было до неё.
+    """
+    if cursor:
+        status, registered_at, order_id = signing.loads(cursor, salt=ORDERS_CURSOR_SALT)
+        registered_at = datetime.datetime.fromisoformat(registered_at)
+        orders = orders.filter(
+            Q(status__gt=status)
+            | Q(status=status, registered_at__gt=registered_at)
+            | Q(status=status, registered_at=registered_at, id__gt=order_id)
+        )
+    page = list(orders.order_by('status', 'registered_at', 'id')[:ORDERS_PAGE_SIZE + 1])
+    next_cursor = encode_orders_cursor(page[ORDERS_PAGE_SIZE - 1]) if len(page) > ORDERS_PAGE_SIZE else None
+    return page[:ORDERS_PAGE_SIZE], next_cursor
+
+
 @user_passes_test(lambda user: user.is_staff, login_url='restaurateur:login')
 def view_orders(request):
-
     orders = Order.objects.filter(
-        ~Q(status__in=['cls', 'cnc'])  # Исключаем закрытые и отмененные заказы
-    ).select_related('restaurant').prefetch_related('items').annotate(
-        total_price=Sum(F('items__price') * F('items__quantity'))
-    )
+        ~Q(status__in=EXCLUDED_ORDER_STATUSES)  # Исключаем закрытые и отмененные заказы
+    ).select_related('restaurant').prefetch_related(prefetch_candidates())
+
+    order_filter = OrderFilter(request.GET)
+    if order_filter.is_valid():
+        orders = order_filter.filter(orders)
+
+    try:
+        orders, next_cursor = paginate_orders(orders, request.GET.get('after'))
+    except signing.BadSignature:
+        return redirect('restaurateur:view_orders')
+
+    # Курсор ленты берём до чтения заказов, чтобы не пропустить изменения во время рендера
+    feed_cursor = encode_feed_cursor(timezone.now())
+
+    # Кандидаты с расстояниями уже лежат в OrderCandidate и читаются одним
+    # запросом по индексу; их пересчитывают события заказов, меню и ресторанов
+    process_orders(orders)
 
-    restaurants = Restaurant.objects.all()
-    addresses = set(restaurant.address for restaurant in restaurants)
-    addresses.update(order.address for order in orders)
-    place_map = {place.address: place for place in Place.objects.filter(address__in=addresses)}
-    api_key = settings.YANDEX_GEOCODER_API_KEY
+    next_page_query = None
+    if next_cursor:
+        query = request.GET.copy()
+        query['after'] = next_cursor
+        next_page_query = query.urlencode()
+    first_page_query = None
+    if 'after' in request.GET:
+        query = request.GET.copy()
+        del query['after']
+        first_page_query = query.urlencode()
 
-    restaurant_coordinates = process_restaurants(restaurants, place_map, api_key)
-    available_restaurants_data = process_orders(orders, restaurant_coordinates, place_map, api_key)
+    feed_query = request.GET.copy()
+    feed_query.pop('after', None)
+    feed_query['cursor'] = feed_cursor
 
     context = {
-        'orders': orders.order_by('status'),
-        'excluded_statuses': ['cls', 'cnc'],
-        'available_restaurants_data': available_restaurants_data,
+        'orders': orders,
+        'order_filter': order_filter,
+        'next_page_query': next_page_query,
+        'first_page_query': first_page_query,
+        'feed_query': feed_query.urlencode(),
+        'orders_url': reverse('restaurateur:view_orders'),
     }
     return render(request, 'order_items.html', context)
+
+
+def encode_feed_cursor(updated_at):
+    return updated_at.isoformat()
+
+
+def decode_feed_cursor(cursor):
+    try:
+        # Курсоры старого формата «время|id» тоже понимаем
+        return datetime.datetime.fromisoformat(cursor.split('|')[0])
+    except (AttributeError, ValueError):
+        return timezone.now()
+
+
+def fetch_order_changes(watermark, sent_versions, order_filter, orders_url):
+    """Изменения заказов, которых лента ещё не отправляла, и новая отметка времени.
+
+    updated_at ставит приложение до фиксации транзакции, поэтому заказ
+    из долгой транзакции или с сервера с отстающими часами появляется
+    в базе с отметкой раньше уже отправленных. Поэтому каждый опрос
+    перечитывает окно ORDERS_FEED_OVERLAP перед отметкой, а версии
+    заказов (id, updated_at) из sent_versions пропускает.
+    """
+    window_start = watermark - ORDERS_FEED_OVERLAP
+    for order_id, updated_at in list(sent_versions.items()):
+        if updated_at <= window_start:
+            del sent_versions[order_id]
+
+    # Сначала только версии заказов по индексу updated_at: большинство
+    # опросов на этом и заканчивается, без чтения и отрисовки заказов
+    versions = (
+        Order.objects
+        .filter(updated_at__gt=window_start)
+        .order_by('updated_at', 'id')
+        .values_list('id', 'updated_at')
+    )
+    new_ids = [
+        order_id for order_id, updated_at in versions
+        if sent_versions.get(order_id) != updated_at
+    ][:ORDERS_FEED_BATCH_SIZE]
+    if not new_ids:
+        return [], watermark
+
+    changed_orders = list(
+        Order.objects
+        .filter(id__in=new_ids)
+        .select_related('restaurant')
+        .prefetch_related(prefetch_candidates())
+        .order_by('updated_at', 'id')
+    )
+    visible_orders = Order.objects.filter(
+        id__in=new_ids
+    ).exclude(status__in=EXCLUDED_ORDER_STATUSES)
+    if order_filter.is_valid():
+        visible_orders = order_filter.filter(visible_orders)
+    visible_ids = set(visible_orders.values_list('id', flat=True))
+
+    orders = [order for order in changed_orders if order.id in visible_ids]
+    process_orders(orders)
+
+    changes = []
+    for order in changed_orders:
+        sent_versions[order.id] = order.updated_at
+        watermark = max(watermark, order.updated_at)
+        if order.id not in visible_ids:
+            changes.append({'id': order.id, 'removed': True})
+            continue
+        changes.append({
+            'id': order.id,
+            'html': render_to_string('order_row.html', {'order': order, 'orders_url': orders_url}),
+        })
+    return changes, watermark
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_orders_feed(request):
+    """Лента изменений заказов в формате Server-Sent Events.
+
+    Соединение живёт ORDERS_FEED_DURATION секунд, затем браузер сам
+    переподключается и присылает последнюю отметку времени в Last-Event-ID.
+    После переподключения заказы из окна перекрытия приходят ещё раз,
+    страница просто перерисует их строки.
+    """
+    watermark = decode_feed_cursor(
+        request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    )
+    order_filter = OrderFilter(request.GET)
+    orders_url = reverse('restaurateur:view_orders')
+
+    def stream_events():
+        nonlocal watermark
+        sent_versions = {}
+        yield f'retry: {ORDERS_FEED_RETRY_MS}\n\n'
+        finish_at = time.monotonic() + ORDERS_FEED_DURATION
+        while time.monotonic() < finish_at:
+            changes, watermark = fetch_order_changes(watermark, sent_versions, order_filter, orders_url)
+            if changes:
+                data = json.dumps(changes, ensure_ascii=False)
+                yield f'id: {encode_feed_cursor(watermark)}\nevent: orders\ndata: {data}\n\n'
+            else:
+                yield ': ping\n\n'
+                time.sleep(ORDERS_FEED_POLL_INTERVAL)
+
+    response = StreamingHttpResponse(stream_events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_geocoder_stats(request):
+    # Счётчики клиента геокодера и кэша координат в текущем процессе
+    stats = get_geocoder().get_stats()
+    stats['coordinate_cache'] = get_coordinate_cache().get_stats()
+    return JsonResponse(stats)
@@ -15,6 +15,27 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', False)
 YANDEX_GEOCODER_API_KEY = env('YANDEX_GEOCODER_API_KEY')
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 5)
+GEOCODER_DEADLINE = env.float('GEOCODER_DEADLINE', 10)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_POOL_SIZE = env.int('GEOCODER_POOL_SIZE', 10)
+GEOCODER_FAILURE_THRESHOLD = env.int('GEOCODER_FAILURE_THRESHOLD', 5)
+GEOCODER_RECOVERY_TIMEOUT = env.float('GEOCODER_RECOVERY_TIMEOUT', 30)
+GEOCODER_RATE_LIMIT = env.int('GEOCODER_RATE_LIMIT', 10)
+GEOCODER_BACKOFF_BASE = env.float('GEOCODER_BACKOFF_BASE', 5 * 60)
+GEOCODER_BACKOFF_MAX = env.float('GEOCODER_BACKOFF_MAX', 7 * 24 * 60 * 60)
+GEOCODER_LEASE = env.float('GEOCODER_LEASE', 10 * 60)
+COORDINATE_CACHE_SIZE = env.int('COORDINATE_CACHE_SIZE', 10000)
+COORDINATE_CACHE_TTL = env.int('COORDINATE_CACHE_TTL', 5 * 60)
+COORDINATE_CACHE_SHARED_TTL = env.int('COORDINATE_CACHE_SHARED_TTL', 24 * 60 * 60)
+PLACE_TOUCH_BATCH_SIZE = env.int('PLACE_TOUCH_BATCH_SIZE', 500)
+PLACE_TOUCH_INTERVAL = env.float('PLACE_TOUCH_INTERVAL', 5)
+GEODESIC_DISTANCES = env.bool('GEODESIC_DISTANCES', False)
+DELIVERY_RADIUS_KM = env.float('DELIVERY_RADIUS_KM', None)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', 60)
+ORDERS_BATCH_MAX_SIZE = env.int('ORDERS_BATCH_MAX_SIZE', 5000)
+ORDER_INTAKE_MODE = env.bool('ORDER_INTAKE_MODE', False)
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
 ROLLBAR_ACCESS_TOKEN = env('ROLLBAR_ACCESS_TOKEN', default='')
 ROLLBAR_ENVIRONMENT = env('ROLLBAR_ENVIRONMENT', default='production')
@@ -91,6 +112,10 @@ ROLLBAR = {
 
 WSGI_APPLICATION = 'star_burger.wsgi.application'
 
+CATALOG_SNAPSHOT_PATH = env.str(
+    'CATALOG_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'var', 'catalog.snapshot')
+)
+
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
@@ -104,6 +129,11 @@ DATABASES['default']['OPTIONS'] = {
     'options': '-c search_path=starburger_db_schema'
 }
 
+# Для нескольких воркеров gunicorn нужен общий кэш, например redis://
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', default='locmem://'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',